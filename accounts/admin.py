@@ -1,3 +1,25 @@
 from django.contrib import admin
+from config.paginators import EstimatedCountPaginator
+from .models import CustomUser
 
-# Register your models here.
+@admin.register(CustomUser)
+class CustomUserAdmin(admin.ModelAdmin):
+    """Minimal user admin; it mainly backs the user autocomplete of other admins."""
+    list_display = ('email', 'is_active', 'is_staff', 'created_at')
+    list_filter = ('is_active', 'is_staff')
+    search_fields = ('email',)
+    ordering = ('email',)
+    # Not a full user admin: accounts are created with createsuperuser or the
+    # app, and privileges aren't editable here. Only deactivation is.
+    fields = ('email', 'is_active', 'is_staff', 'last_login', 'created_at')
+    readonly_fields = ('email', 'is_staff', 'last_login', 'created_at')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # The stock delete cascades to every capture in one transaction; use
+        # `manage.py purge_account`, which purges them in batches.
+        return False
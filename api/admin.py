@@ -1,3 +1,23 @@
 from django.contrib import admin
+from .models import APIToken
 
-# Register your models here.
+@admin.register(APIToken)
+class APITokenAdmin(admin.ModelAdmin):
+    """Tokens are created with `manage.py create_api_token`, which shows the key once."""
+    list_display = ('name', 'user', 'prefix', 'scopes', 'created_at', 'last_used_at', 'expires_at', 'revoked_at')
+    list_select_related = ('user',)
+    list_filter = ('revoked_at',)
+    search_fields = ('name', '=prefix', '=user__email')
+    fields = ('user', 'name', 'prefix', 'scopes', 'created_at', 'last_used_at', 'expires_at', 'revoked_at')
+    readonly_fields = fields
+    actions = ['revoke_selected']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Revoke selected tokens', permissions=['change'])
+    def revoke_selected(self, request, queryset):
+        tokens = list(queryset.filter(revoked_at__isnull=True))
+        for token in tokens:
+            token.revoke()  # per token, so each cached principal is evicted
+        self.message_user(request, f'Revoked {len(tokens)} tokens.')
@@ -0,0 +1,226 @@
+"""
+API token authentication.
+
+Clients send ``Authorization: Bearer mzb_…`` to URLs under ``/api/``.
+``TokenAuthenticationMiddleware`` resolves the token to a ``Principal`` (user
+and scopes) and sets ``request.user``, so the API needs neither the session
+table nor a user load. Other URLs, such as the admin, ignore tokens: their
+views don't check scopes.
+
+Verified principals are cached for ``API_TOKEN_CACHE_TTL`` seconds; saving or
+revoking a token and changing its user's access evict them (see
+``api.models``). Unknown and inactive keys are cached as rejected for
+``API_TOKEN_REJECTED_CACHE_TTL`` seconds, and lookups that miss the cache are
+rate limited per client IP (the ``api-token-lookup`` scope of
+``RATE_LIMITS``), so guessing keys can't hammer the token table. The eviction reaches other worker processes only through a
+shared cache (``DJANGO_REDIS_URL``); with the in-memory default they keep
+their copy until it expires. ``last_used_at`` is buffered per process and
+written for all used tokens in one UPDATE every
+``API_TOKEN_LAST_USED_INTERVAL`` seconds.
+"""
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import JsonResponse
+from django.utils import timezone
+
+from config.instrumentation import registry
+from config.ratelimit import check_rate, client_ip, throttled
+from .models import APIToken, hash_token, token_cache_key
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PREFIX = 'mzb_'
+API_PATH_PREFIX = '/api/'  # where config.urls mounts api.urls
+LOOKUP_SCOPE = 'api-token-lookup'
+REJECTED = 'rejected'  # cached in place of a principal
+
+Principal = namedtuple('Principal', ['token_id', 'user', 'scopes', 'expires_at'])
+
+registry.describe('muzebox_api_token_auth_total', 'API token authentications, by how they were resolved.', 'counter')
+
+
+class LastUsedBuffer:
+    """Collects the ids of tokens used since the last flush."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._flushed_at = time.monotonic()
+
+    def touch(self, token_id):
+        with self._lock:
+            self._pending.add(token_id)
+
+    def due(self):
+        interval = getattr(settings, 'API_TOKEN_LAST_USED_INTERVAL', 60)
+        with self._lock:
+            return bool(self._pending) and time.monotonic() - self._flushed_at >= interval
+
+    def flush(self):
+        """Stamp every pending token with the current time. Returns the number of tokens."""
+        with self._lock:
+            ids, self._pending = self._pending, set()
+            self._flushed_at = time.monotonic()
+        if ids:
+            # Explicitly on the primary: bookkeeping shouldn't pin the client to it.
+            APIToken.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=ids).update(last_used_at=timezone.now())
+        return len(ids)
+
+
+last_used = LastUsedBuffer()
+
+
+class LookupThrottled(Exception):
+    """A client made too many token lookups that missed the cache."""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def authenticate_token(key, client=None):
+    """
+    Return the ``Principal`` for an active token, or ``None``. Raise
+    ``LookupThrottled`` if the key isn't cached and ``client`` has used up its
+    lookups.
+
+    A token revoked while its lookup is in flight can stay cached for up to
+    ``API_TOKEN_CACHE_TTL`` seconds.
+    """
+    key_hash = hash_token(key)
+    principal = cache.get(token_cache_key(key_hash))
+    if principal is None:
+        if client is not None:
+            retry_after = check_rate(LOOKUP_SCOPE, client)
+            if retry_after:
+                raise LookupThrottled(retry_after)
+        token = APIToken.objects.select_related('user').filter(key_hash=key_hash).first()
+        if token is None or not token.is_active or not token.user.is_active:
+            cache.set(token_cache_key(key_hash), REJECTED, getattr(settings, 'API_TOKEN_REJECTED_CACHE_TTL', 10))
+            registry.inc('muzebox_api_token_auth_total', (('result', 'rejected'),))
+            return None
+        principal = Principal(token.pk, token.user, frozenset(token.scopes), token.expires_at)
+        cache.set(token_cache_key(key_hash), principal, getattr(settings, 'API_TOKEN_CACHE_TTL', 60))
+        registry.inc('muzebox_api_token_auth_total', (('result', 'database'),))
+    elif principal == REJECTED:
+        registry.inc('muzebox_api_token_auth_total', (('result', 'rejected'),))
+        return None
+    elif principal.expires_at is not None and principal.expires_at <= timezone.now():
+        registry.inc('muzebox_api_token_auth_total', (('result', 'rejected'),))
+        return None
+    else:
+        registry.inc('muzebox_api_token_auth_total', (('result', 'cache'),))
+    last_used.touch(principal.token_id)
+    return principal
+
+
+def bearer_token(request):
+    """
+    The API token from the Authorization header of an API request. Other
+    bearer tokens, and tokens sent to non-API URLs, are ignored.
+    """
+    if not request.path_info.startswith(API_PATH_PREFIX):
+        return None
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    key = key.strip()
+    if scheme.lower() == 'bearer' and key.startswith(TOKEN_PREFIX):
+        return key
+    return None
+
+
+class TokenAuthenticationMiddleware:
+    """
+    Authenticate requests carrying an API token. Must come after
+    ``AuthenticationMiddleware``, whose lazy session user it replaces.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = bearer_token(request)
+        if key is None:
+            return self.get_response(request)
+        try:
+            principal = authenticate_token(key, f'ip:{client_ip(request)}')
+        except LookupThrottled as e:
+            return throttled(LOOKUP_SCOPE, 'rate_limited', e.retry_after)
+        if principal is None:
+            return self.rejected()
+        self.login(request, principal)
+        response = self.get_response(request)
+        self.flush_last_used()
+        return response
+
+    async def __acall__(self, request):
+        key = bearer_token(request)
+        if key is None:
+            return await self.get_response(request)
+        try:
+            principal = await sync_to_async(authenticate_token)(key, f'ip:{client_ip(request)}')
+        except LookupThrottled as e:
+            return throttled(LOOKUP_SCOPE, 'rate_limited', e.retry_after)
+        if principal is None:
+            return self.rejected()
+        self.login(request, principal)
+        response = await self.get_response(request)
+        if last_used.due():
+            await sync_to_async(self.flush_last_used)()
+        return response
+
+    def login(self, request, principal):
+        user = principal.user
+
+        async def auser():
+            return user
+
+        request.user = user
+        request.auser = auser
+        request.api_token = principal
+        # The token isn't sent automatically by browsers, so CSRF doesn't apply.
+        request._dont_enforce_csrf_checks = True
+
+    def rejected(self):
+        response = JsonResponse({'detail': 'Invalid or revoked API token.'}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    def flush_last_used(self):
+        if not last_used.due():
+            return
+        try:
+            last_used.flush()
+        except Exception:
+            logger.exception('Could not record API token usage')
+
+
+def require_scope(scope):
+    """Reject token-authenticated requests whose token lacks ``scope``. Sessions have every scope."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            principal = getattr(request, 'api_token', None)
+            if principal is not None and scope not in principal.scopes:
+                return JsonResponse(
+                    {'detail': 'This token does not allow this action.', 'required_scope': scope},
+                    status=403,
+                )
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import APIToken
+
+
+class Command(BaseCommand):
+    help = 'Create an API token for a user and print its key. The key cannot be shown again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--name', default='API token')
+        parser.add_argument(
+            '--scope', action='append', choices=APIToken.SCOPES, dest='scopes',
+            help='Grant a scope; repeat for several. Defaults to all scopes.',
+        )
+        parser.add_argument('--expires-in-days', type=float, default=None)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}.')
+        expires_at = None
+        if options['expires_in_days'] is not None:
+            expires_at = timezone.now() + timedelta(days=options['expires_in_days'])
+        token, key = APIToken.objects.create_token(user, options['name'], options['scopes'], expires_at)
+        self.stdout.write(f'Created token "{token.name}" for {user.email}: {key}')
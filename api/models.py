@@ -1,3 +1,111 @@
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+def hash_token(key):
+    """Tokens are random and long, so a fast unsalted hash is enough to store them."""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_cache_key(key_hash):
+    return f'apitoken:{key_hash}'
+
+
+class APITokenManager(models.Manager):
+    def create_token(self, user, name, scopes=None, expires_at=None):
+        """Create a token; returns ``(token, key)``. The key is only available here."""
+        prefix = secrets.token_hex(4)
+        key = f'mzb_{prefix}_{secrets.token_urlsafe(32)}'
+        token = self.create(
+            user=user,
+            name=name,
+            prefix=prefix,
+            key_hash=hash_token(key),
+            scopes=list(scopes if scopes is not None else APIToken.SCOPES),
+            expires_at=expires_at,
+        )
+        return token, key
+
+
+class APIToken(models.Model):
+    """A revocable, scoped API credential for mobile and sync clients."""
+    SCOPES = ('captures:read', 'captures:write', 'tags:write')
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='api_tokens'
+    )
+    name = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=8, help_text='Identifies the token to its owner.')
+    key_hash = models.CharField(max_length=64, unique=True)
+    scopes = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    objects = APITokenManager()
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'API token'
+
+    def __str__(self):
+        return f'{self.name} (mzb_{self.prefix}_…)'
+
+    @property
+    def is_active(self):
+        if self.revoked_at is not None:
+            return False
+        return self.expires_at is None or self.expires_at > timezone.now()
+
+    def revoke(self):
+        self.revoked_at = timezone.now()
+        self.save(update_fields=['revoked_at'])
+
+
+@receiver(post_save, sender=APIToken)
+@receiver(post_delete, sender=APIToken)
+def invalidate_token(sender, instance, **kwargs):
+    cache.delete(token_cache_key(instance.key_hash))
+
+
+# User fields that decide what a cached principal may do.
+PRINCIPAL_USER_FIELDS = ('is_active', 'is_staff')
+
+
+def principal_state(user):
+    # Read from __dict__ so deferred fields aren't loaded; None if any is.
+    state = tuple(user.__dict__.get(field) for field in PRINCIPAL_USER_FIELDS)
+    return None if None in state else state
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_principal_state(sender, instance, **kwargs):
+    instance._principal_state = principal_state(instance)
+
 
-# Create your models here.
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created, update_fields, **kwargs):
+    """
+    Drop cached principals when a user's access changes, e.g. they are
+    deactivated. Other saves, such as ``update_last_login``, cost no query.
+    Deleting a user deletes its tokens, which evicts them one by one.
+    """
+    state, instance._principal_state = instance._principal_state, principal_state(instance)
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & set(PRINCIPAL_USER_FIELDS):
+        return
+    if state is not None and state == instance._principal_state:
+        return
+    key_hashes = APIToken.objects.filter(user_id=instance.pk).values_list('key_hash', flat=True)
+    cache.delete_many([token_cache_key(key_hash) for key_hash in key_hashes])
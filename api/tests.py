@@ -1,3 +1,389 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import warnings
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from captures.models import Capture, MediaCapture, TextCapture, upload_prefix
+from .authentication import authenticate_token, last_used
+from .models import APIToken
+from tags.models import Tag
+from tags.operations import add_tag
+from .views import MAX_PAGE_SIZE
+
+
+class CaptureApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user('owner@example.com', 'pw')
+        cls.other = User.objects.create_user('other@example.com', 'pw')
+        cls.tag = Tag.objects.create(user=cls.user, name='ideas')
+        cls.captures = [
+            Capture.objects.create(user=cls.user, title=f'Note {i}', capture_type='TEXT')
+            for i in range(3)
+        ]
+        cls.captures[0].tags.add(cls.tag)
+        TextCapture.objects.create(capture=cls.captures[0], content='<p>hello world</p>')
+        cls.audio = Capture.objects.create(user=cls.user, title='Memo', capture_type='AUDIO')
+        cls.foreign = Capture.objects.create(user=cls.other, title='Not mine', capture_type='TEXT')
+
+    def setUp(self):
+        cache.clear()  # rate limit buckets
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get(reverse('api:capture-list'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_list_is_scoped_filtered_and_paginated(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('api:capture-list'), {'limit': 2})
+        data = response.json()
+        self.assertEqual([c['title'] for c in data['results']], ['Memo', 'Note 2'])
+        response = await self.async_client.get(
+            reverse('api:capture-list'), {'limit': 2, 'before': data['next']}
+        )
+        self.assertEqual([c['title'] for c in response.json()['results']], ['Note 1', 'Note 0'])
+
+        response = await self.async_client.get(reverse('api:capture-list'), {'tag': 'ideas'})
+        self.assertEqual([c['tags'] for c in response.json()['results']], [['ideas']])
+
+    async def test_detail_includes_content(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('api:capture-detail', args=[self.captures[0].pk]))
+        self.assertEqual(response.json()['content'], '<p>hello world</p>')
+        response = await self.async_client.get(reverse('api:capture-detail', args=[self.foreign.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_changes_returns_updates_since_cursor(self):
+        await self.async_client.aforce_login(self.user)
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        response = await self.async_client.get(reverse('api:capture-changes'), {'since': since})
+        data = response.json()
+        self.assertEqual(len(data['results']), 4)
+        response = await self.async_client.get(
+            reverse('api:capture-changes'), {'since': data['cursor'], 'wait': 0}
+        )
+        self.assertEqual(response.json()['results'], [])
+
+    def test_changes_cursor_pages_through_rows_with_one_timestamp(self):
+        captures = Capture.objects.bulk_create([
+            Capture(user=self.user, title=f'Bulk {i}', capture_type='TEXT') for i in range(MAX_PAGE_SIZE + 50)
+        ])
+        since = timezone.now().isoformat()
+        add_tag(self.tag, Capture.objects.filter(pk__in=[c.pk for c in captures]))
+        self.client.force_login(self.user)
+        seen = []
+        while True:
+            data = self.client.get(reverse('api:capture-changes'), {'since': since}).json()
+            if not data['results']:
+                break
+            seen += [c['id'] for c in data['results']]
+            since = data['cursor']
+        self.assertEqual(sorted(seen), sorted(c.pk for c in captures))
+
+    async def test_export_streams_ndjson(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('api:capture-export'), {'type': 'text'})
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Note 0', 'Note 1', 'Note 2'])
+        self.assertEqual(rows[0]['content'], '<p>hello world</p>')
+
+    def test_export_streams_under_wsgi(self):
+        self.client.force_login(self.user)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')  # Django warns when it buffers an async iterator
+            response = self.client.get(reverse('api:capture-export'), {'type': 'text'})
+            self.assertFalse(response.is_async)
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        response.close()
+        self.assertEqual([row['title'] for row in rows], ['Note 0', 'Note 1', 'Note 2'])
+
+
+    async def test_trash_restore_and_changes(self):
+        await self.async_client.aforce_login(self.user)
+        since = timezone.now().isoformat()
+        response = await self.async_client.post(reverse('api:capture-trash', args=[self.captures[1].pk]))
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.async_client.get(reverse('api:capture-list'))
+        self.assertNotIn('Note 1', [c['title'] for c in response.json()['results']])
+        response = await self.async_client.get(reverse('api:trash-list'))
+        self.assertEqual([c['title'] for c in response.json()['results']], ['Note 1'])
+        response = await self.async_client.get(reverse('api:capture-changes'), {'since': since})
+        [change] = response.json()['results']
+        self.assertIsNotNone(change['deleted_at'])
+
+        response = await self.async_client.post(reverse('api:capture-restore', args=[self.captures[1].pk]))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('api:trash-list'))
+        self.assertEqual(response.json()['results'], [])
+
+        response = await self.async_client.post(reverse('api:capture-trash', args=[self.foreign.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(RATE_LIMITS={'capture-read': {'user': '1/m'}})
+    async def test_reads_are_rate_limited_per_user(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('api:capture-list'))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('api:capture-list'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+    @override_settings(RATE_LIMITS={'capture-read': {'user': '1/m'}})
+    def test_limit_applies_before_authentication(self):
+        self.assertEqual(self.client.get(reverse('api:capture-list')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('api:capture-list')).status_code, 429)
+
+        cache.clear()
+        self.client.force_login(self.user)
+        self.client.get(reverse('api:capture-list'))
+        with self.assertNumQueries(0):  # no session or user lookup
+            response = self.client.get(reverse('api:capture-list'))
+        self.assertEqual(response.status_code, 429)
+
+
+class TagApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('owner@example.com', 'pw')
+        self.work = Tag.objects.create(user=self.user, name='work')
+        self.job = Tag.objects.create(user=self.user, name='job')
+        self.texts = Capture.objects.bulk_create([
+            Capture(user=self.user, title=f'Note {i}', capture_type='TEXT') for i in range(3)
+        ])
+        self.audio = Capture.objects.create(user=self.user, title='Memo', capture_type='AUDIO')
+        self.client.force_login(self.user)
+
+    def post(self, name, pk, payload):
+        return self.client.post(reverse(name, args=[pk]), json.dumps(payload), content_type='application/json')
+
+    def test_bulk_assign_by_filter_and_ids(self):
+        response = self.post('api:tag-captures', self.work.pk, {'action': 'add', 'filter': {'type': 'text'}})
+        self.assertEqual(response.json()['captures'], 3)
+        self.assertEqual(self.work.capture_set.count(), 3)
+
+        response = self.post('api:tag-captures', self.work.pk, {'action': 'remove', 'ids': [self.texts[0].pk]})
+        self.assertEqual(response.json()['captures'], 1)
+        self.assertEqual(self.work.capture_set.count(), 2)
+
+        response = self.post('api:tag-captures', self.work.pk, {'action': 'add'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rename_conflict_and_merge(self):
+        self.texts[0].tags.add(self.work)
+        response = self.post('api:tag-rename', self.work.pk, {'name': 'job'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflict'], {'id': self.job.pk, 'name': 'job'})
+
+        response = self.post('api:tag-rename', self.work.pk, {'name': 'job', 'merge': True})
+        self.assertEqual(response.json(), {'id': self.job.pk, 'name': 'job'})
+        self.assertEqual(list(self.texts[0].tags.all()), [self.job])
+
+    def test_merge(self):
+        self.texts[0].tags.add(self.work)
+        response = self.post('api:tag-merge', self.work.pk, {'into': self.job.pk})
+        self.assertEqual(response.json()['captures'], 1)
+        response = self.client.get(reverse('api:tag-list'))
+        self.assertEqual(response.json()['results'], [{'id': self.job.pk, 'name': 'job'}])
+
+
+class UploadCompleteTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user('owner@example.com', 'pw')
+        self.capture = Capture.objects.create(user=self.user, title='Memo', capture_type='AUDIO')
+        self.client.force_login(self.user)
+
+    def upload(self, name, data=b'x' * 42):
+        path = Path(self.media_root, name)
+        path.parent.mkdir(parents=True)
+        path.write_bytes(data)
+
+    def post(self, payload):
+        return self.client.post(
+            reverse('api:capture-upload-complete', args=[self.capture.pk]),
+            json.dumps(payload),
+            content_type='application/json',
+        )
+
+    def upload_target(self, capture=None):
+        response = self.client.post(
+            reverse('api:capture-upload-target', args=[(capture or self.capture).pk]),
+            json.dumps({'filename': 'memo.MP3'}),
+            content_type='application/json',
+        )
+        return response.json()['file']
+
+    def test_attaches_uploaded_file(self):
+        name = self.upload_target()
+        self.assertTrue(name.startswith(upload_prefix(self.capture)) and name.endswith('.mp3'))
+        self.upload(name)
+        response = self.post({'file': name, 'duration_seconds': 12.5})
+        self.assertEqual(response.status_code, 200)
+        media = MediaCapture.objects.get(capture=self.capture)
+        self.assertEqual(media.file_size, 42)
+        self.capture.refresh_from_db()
+        self.assertEqual(self.capture.metadata, {'file_size': 42, 'duration_seconds': 12.5})
+
+        response = self.client.get(reverse('api:capture-media', args=[self.capture.pk]))
+        self.assertTrue(response.json()['url'].endswith('.mp3'))
+
+        self.capture.delete()
+        response = self.client.get(reverse('api:capture-media', args=[self.capture.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_rejects_missing_or_foreign_files(self):
+        prefix = upload_prefix(self.capture)
+        self.assertEqual(self.post({'file': f'{prefix}missing.mp3'}).status_code, 400)
+        self.assertEqual(self.post({'file': f'{prefix}../../../etc/passwd'}).status_code, 400)
+
+        # Another user's upload, even of the same type and month.
+        other = Capture.objects.create(
+            user=get_user_model().objects.create_user('other@example.com', 'pw'),
+            title='Theirs', capture_type='AUDIO',
+        )
+        foreign = f'{upload_prefix(other)}theirs.mp3'
+        self.upload(foreign)
+        self.assertEqual(self.post({'file': foreign}).status_code, 400)
+        self.assertFalse(MediaCapture.objects.exists())
+
+
+@override_settings(API_TOKEN_LAST_USED_INTERVAL=3600)
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        last_used.flush()
+        self.user = get_user_model().objects.create_user('owner@example.com', 'pw')
+        self.capture = Capture.objects.create(user=self.user, title='Note', capture_type='TEXT')
+        self.token, self.key = APIToken.objects.create_token(self.user, 'phone')
+        self.client = Client(enforce_csrf_checks=True, headers={'Authorization': f'Bearer {self.key}'})
+
+    def test_authenticates_without_a_session(self):
+        response = self.client.get(reverse('api:capture-list'))
+        self.assertEqual([c['title'] for c in response.json()['results']], ['Note'])
+        self.assertNotIn('sessionid', response.cookies)
+
+        response = self.client.post(reverse('api:capture-trash', args=[self.capture.pk]))
+        self.assertEqual(response.status_code, 200)  # no CSRF token needed
+
+    def test_rejects_unknown_and_revoked_tokens(self):
+        response = self.client.get(reverse('api:capture-list'), headers={'Authorization': 'Bearer mzb_nope'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+        self.token.revoke()
+        self.assertEqual(self.client.get(reverse('api:capture-list')).status_code, 401)
+
+    def test_scopes(self):
+        _, key = APIToken.objects.create_token(self.user, 'reader', scopes=['captures:read'])
+        headers = {'Authorization': f'Bearer {key}'}
+        self.assertEqual(self.client.get(reverse('api:capture-list'), headers=headers).status_code, 200)
+        response = self.client.post(reverse('api:capture-trash', args=[self.capture.pk]), headers=headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['required_scope'], 'captures:write')
+
+    def test_principal_is_cached_until_invalidated(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate_token(self.key).user, self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(authenticate_token(self.key).token_id, self.token.pk)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authenticate_token(self.key))
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertIsNotNone(authenticate_token(self.key))
+        self.token.revoke()
+        self.assertIsNone(authenticate_token(self.key))
+
+    def test_rejected_keys_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate_token('mzb_nope'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(authenticate_token('mzb_nope'))
+
+    @override_settings(RATE_LIMITS={'api-token-lookup': {'user': '2/m'}})
+    def test_lookups_are_rate_limited_per_client(self):
+        for key in ('mzb_one', 'mzb_two'):
+            response = self.client.get(reverse('api:capture-list'), headers={'Authorization': f'Bearer {key}'})
+            self.assertEqual(response.status_code, 401)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api:capture-list'), headers={'Authorization': 'Bearer mzb_three'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client.get(reverse('api:capture-list')).status_code, 429)
+        # Other clients have their own budget, and cached keys aren't looked up.
+        self.assertEqual(self.client.get(reverse('api:capture-list'), REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.assertEqual(self.client.get(reverse('api:capture-list')).status_code, 200)
+
+    def test_saves_that_keep_access_keep_the_cache(self):
+        authenticate_token(self.key)
+        with self.assertNumQueries(1):  # just the UPDATE
+            update_last_login(None, self.user)
+        with self.assertNumQueries(1):
+            self.user.save()
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(authenticate_token(self.key))
+
+    def test_expired_token(self):
+        self.token.expires_at = timezone.now() - timedelta(seconds=1)
+        self.token.save()
+        self.assertIsNone(authenticate_token(self.key))
+
+    def test_last_used_is_written_in_batches(self):
+        _, other_key = APIToken.objects.create_token(self.user, 'laptop')
+        for key in (self.key, self.key, other_key):
+            self.client.get(reverse('api:capture-list'), headers={'Authorization': f'Bearer {key}'})
+        self.assertFalse(APIToken.objects.filter(last_used_at__isnull=False).exists())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(last_used.flush(), 2)
+        self.assertEqual(APIToken.objects.filter(last_used_at__isnull=False).count(), 2)
+
+    @override_settings(API_TOKEN_LAST_USED_INTERVAL=0)
+    async def test_async_request_flushes_when_due(self):
+        response = await self.async_client.get(
+            reverse('api:capture-list'), headers={'Authorization': f'Bearer {self.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        token = await APIToken.objects.aget(pk=self.token.pk)
+        self.assertIsNotNone(token.last_used_at)
+
+    def test_tokens_only_authenticate_api_urls(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(reverse('admin:accounts_customuser_changelist'))
+        self.assertEqual(response.status_code, 302)  # to the admin login
+        response = self.client.post(reverse('admin:captures_capture_changelist'), {
+            'action': 'trash_selected', '_selected_action': [self.capture.pk],
+        })
+        self.assertEqual(response.status_code, 403)  # CSRF still enforced
+        self.assertTrue(Capture.objects.filter(pk=self.capture.pk).exists())
+
+    @override_settings(RATE_LIMITS={'capture-read': {'user': '1/m'}})
+    def test_rate_limited_per_token_user(self):
+        _, other_key = APIToken.objects.create_token(self.user, 'laptop')
+        self.assertEqual(self.client.get(reverse('api:capture-list')).status_code, 200)
+        response = self.client.get(reverse('api:capture-list'), headers={'Authorization': f'Bearer {other_key}'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_other_bearer_tokens_are_ignored(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
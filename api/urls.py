@@ -0,0 +1,22 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('captures/', views.capture_list, name='capture-list'),
+    path('captures/changes/', views.capture_changes, name='capture-changes'),
+    path('captures/export/', views.capture_export, name='capture-export'),
+    path('captures/trash/', views.trash_list, name='trash-list'),
+    path('captures/<int:pk>/', views.capture_detail, name='capture-detail'),
+    path('captures/<int:pk>/media/', views.capture_media_url, name='capture-media'),
+    path('captures/<int:pk>/trash/', views.capture_trash, name='capture-trash'),
+    path('captures/<int:pk>/restore/', views.capture_restore, name='capture-restore'),
+    path('captures/<int:pk>/upload-target/', views.upload_target, name='capture-upload-target'),
+    path('captures/<int:pk>/upload-complete/', views.upload_complete, name='capture-upload-complete'),
+    path('tags/', views.tag_list, name='tag-list'),
+    path('tags/<int:pk>/merge/', views.tag_merge, name='tag-merge'),
+    path('tags/<int:pk>/rename/', views.tag_rename, name='tag-rename'),
+    path('tags/<int:pk>/captures/', views.tag_captures, name='tag-captures'),
+]
@@ -1,3 +1,466 @@
-from django.shortcuts import render
+"""
+Async JSON API for captures.
 
-# Create your views here.
+Every view is a native coroutine using the async ORM, so under ASGI a request
+waiting on the database, on storage or on a long-poll doesn't hold a worker
+thread. Blocking storage calls run in ``storage_executor``, off the
+per-request thread the async ORM uses.
+
+Clients authenticate with a session or an API token (``api.authentication``);
+token requests are limited to the token's scopes.
+"""
+
+import asyncio
+import json
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist, SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET, require_POST
+
+from captures.models import Capture, MediaCapture, get_upload_path, storage_executor, upload_prefix
+from config.ratelimit import concurrency_limit, rate_limit
+from config.routers import pin_primary
+from tags.models import Tag
+from tags.operations import TagConflict, add_tag, merge_tags, remove_tag, rename_tag
+from .authentication import require_scope
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+EXPORT_CHUNK_SIZE = 500
+LONG_POLL_TIMEOUT = 30  # seconds
+LONG_POLL_INTERVAL = 1  # seconds
+
+
+def api_login_required(view):
+    """Reject anonymous requests with a JSON 401 instead of a login redirect."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return error('Authentication credentials were not provided.', status=401)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def error(detail, status=400, **extra):
+    return JsonResponse({'detail': detail, **extra}, status=status)
+
+
+def json_body(request):
+    """The request body as a JSON object, or ``None`` if it isn't one."""
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def serialize_capture(capture, detail=False):
+    data = {
+        'id': capture.pk,
+        'title': capture.title,
+        'capture_type': capture.capture_type,
+        'created_at': capture.created_at,
+        'updated_at': capture.updated_at,
+        'metadata': capture.metadata,
+        'tags': [tag.name for tag in capture.tags.all()],
+        'deleted_at': capture.deleted_at,
+    }
+    if detail:
+        text = getattr(capture, 'textcapture', None)
+        media = getattr(capture, 'mediacapture', None)
+        if text is not None:
+            data['content'] = text.content
+        if media is not None:
+            data['media'] = {
+                'file': media.file.name,
+                'file_size': media.file_size,
+                'duration_seconds': media.duration.total_seconds() if media.duration else None,
+                'description': media.description,
+            }
+    return data
+
+
+def filter_captures(user, params, manager=Capture.objects):
+    """Captures of ``user`` narrowed by the ``type``, ``tag`` and ``q`` query parameters."""
+    captures = manager.filter(user=user).prefetch_related('tags')
+    if params.get('type'):
+        captures = captures.filter(capture_type=params['type'].upper())
+    if params.get('tag'):
+        captures = captures.filter(tags__name=params['tag'])
+    if params.get('q'):
+        captures = captures.filter(title__icontains=params['q'])
+    return captures
+
+
+def page_size(params):
+    try:
+        return max(1, min(int(params.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return PAGE_SIZE
+
+
+def parse_changes_cursor(value):
+    """
+    Parse a changes cursor, ``<ISO timestamp>`` or ``<ISO timestamp>,<id>``,
+    into ``(timestamp, id or None)``; ``None`` if it's invalid. The id breaks
+    ties between captures updated in the same statement.
+    """
+    timestamp, _, pk = value.partition(',')
+    since = parse_datetime(timestamp)
+    if since is None or (pk and not pk.isdigit()):
+        return None
+    return since, int(pk) if pk else None
+
+
+async def keyset_page(request, captures):
+    """Newest-first page of ``captures`` after the ``?before=<id>`` cursor."""
+    limit = page_size(request.GET)
+    captures = captures.order_by('-pk')
+    if request.GET.get('before', '').isdigit():
+        captures = captures.filter(pk__lt=int(request.GET['before']))
+    results = [serialize_capture(capture) async for capture in captures[:limit + 1]]
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = results[-1]['id']
+    return JsonResponse({'results': results, 'next': next_cursor})
+
+
+@require_GET
+@rate_limit('capture-read')
+@api_login_required
+@require_scope('captures:read')
+async def capture_list(request):
+    """Newest-first captures, keyset-paginated with ``?before=<id>``."""
+    user = await request.auser()
+    return await keyset_page(request, filter_captures(user, request.GET))
+
+
+@require_GET
+@rate_limit('capture-read')
+@api_login_required
+@require_scope('captures:read')
+async def capture_detail(request, pk):
+    user = await request.auser()
+    try:
+        capture = await (
+            Capture.objects.select_related('textcapture', 'mediacapture')
+            .prefetch_related('tags')
+            .aget(pk=pk, user=user)
+        )
+    except Capture.DoesNotExist:
+        return error('Not found.', status=404)
+    return JsonResponse(serialize_capture(capture, detail=True))
+
+
+@require_GET
+@rate_limit('capture-sync')
+@api_login_required
+@require_scope('captures:read')
+async def capture_changes(request):
+    """
+    Long-poll for captures updated after ``?since=<ISO timestamp>``.
+
+    Waits up to ``?wait=<seconds>`` (capped at ``LONG_POLL_TIMEOUT``) for a change
+    before returning an empty result. Pass the returned ``cursor`` as the next
+    ``since``. Captures moved to the trash are included, with ``deleted_at`` set.
+    """
+    user = await request.auser()
+    cursor = parse_changes_cursor(request.GET.get('since', ''))
+    if cursor is None:
+        return error('A valid "since" timestamp is required.')
+    since, after_pk = cursor
+    try:
+        wait = max(0.0, min(float(request.GET.get('wait', 0)), LONG_POLL_TIMEOUT))
+    except ValueError:
+        return error('"wait" must be a number of seconds.')
+
+    after = Q(updated_at__gt=since)
+    if after_pk is not None:
+        after |= Q(updated_at=since, pk__gt=after_pk)
+    changes = (
+        filter_captures(user, request.GET, Capture.all_objects)
+        .filter(after)
+        .order_by('updated_at', 'pk')
+    )
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        results = [serialize_capture(capture) async for capture in changes[:MAX_PAGE_SIZE]]
+        if results or loop.time() >= deadline:
+            break
+        await asyncio.sleep(min(LONG_POLL_INTERVAL, deadline - loop.time()))
+    if results:
+        # Full microsecond precision; the JSON encoder truncates datetimes to milliseconds.
+        next_cursor = f"{results[-1]['updated_at'].isoformat()},{results[-1]['id']}"
+    else:
+        next_cursor = request.GET['since']
+    return JsonResponse({'results': results, 'cursor': next_cursor})
+
+
+@require_GET
+@rate_limit('capture-read')
+@api_login_required
+@require_scope('captures:read')
+async def trash_list(request):
+    """Captures in the trash, keyset-paginated like the list."""
+    user = await request.auser()
+    return await keyset_page(request, filter_captures(user, request.GET, Capture.trashed))
+
+
+@require_POST
+@rate_limit('capture-write')
+@api_login_required
+@require_scope('captures:write')
+async def capture_trash(request, pk):
+    """Move a capture to the trash. It is purged for good after ``TRASH_RETENTION_DAYS``."""
+    user = await request.auser()
+    if not await Capture.objects.filter(pk=pk, user=user).atrash():
+        return error('Not found.', status=404)
+    return JsonResponse({'id': pk, 'deleted': True})
+
+
+@require_POST
+@rate_limit('capture-write')
+@api_login_required
+@require_scope('captures:write')
+async def capture_restore(request, pk):
+    user = await request.auser()
+    if not await Capture.trashed.filter(pk=pk, user=user).arestore():
+        return error('Not found.', status=404)
+    return JsonResponse({'id': pk, 'deleted': False})
+
+
+@require_GET
+@rate_limit('capture-export')
+@api_login_required
+@require_scope('captures:read')
+@concurrency_limit('export')
+async def capture_export(request):
+    """Stream every matching capture, with its content, as newline-delimited JSON."""
+    user = await request.auser()
+    captures = (
+        filter_captures(user, request.GET)
+        .select_related('textcapture', 'mediacapture')
+        .order_by('pk')
+    )
+
+    def line(capture):
+        return json.dumps(serialize_capture(capture, detail=True), cls=DjangoJSONEncoder) + '\n'
+
+    async def alines():
+        async for capture in captures.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield line(capture)
+
+    def lines():
+        for capture in captures.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield line(capture)
+
+    # A WSGI server can only consume a sync iterator; given an async one,
+    # Django would buffer the whole export in memory first.
+    body = alines() if isinstance(request, ASGIRequest) else lines()
+    response = StreamingHttpResponse(body, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="captures.ndjson"'
+    return response
+
+
+@require_GET
+@rate_limit('capture-read')
+@api_login_required
+@require_scope('captures:read')
+async def capture_media_url(request, pk):
+    user = await request.auser()
+    try:
+        # Filtering across the relation bypasses Capture's trash-excluding manager.
+        media = await MediaCapture.objects.aget(capture__pk=pk, capture__user=user, capture__is_deleted=False)
+    except MediaCapture.DoesNotExist:
+        return error('Not found.', status=404)
+    return JsonResponse({'url': await media.aget_presigned_url()})
+
+
+@require_POST
+@rate_limit('capture-write')
+@api_login_required
+@require_scope('captures:write')
+async def upload_target(request, pk):
+    """
+    Issue the storage name a client should upload a capture's media to
+    directly, e.g. ``{"filename": "memo.mp3"}`` -> ``{"file": "captures/audio/…/<uuid>.mp3"}``.
+    """
+    user = await request.auser()
+    payload = json_body(request) or {}
+    try:
+        capture = await Capture.objects.aget(pk=pk, user=user)
+    except Capture.DoesNotExist:
+        return error('Not found.', status=404)
+    if capture.capture_type not in ('AUDIO', 'VIDEO'):
+        return error('Only audio and video captures accept uploads.')
+    filename = payload.get('filename')
+    if not isinstance(filename, str) or '.' not in filename:
+        return error('"filename" with an extension is required.')
+    return JsonResponse({'file': get_upload_path(MediaCapture(capture=capture), filename)})
+
+
+@require_POST
+@rate_limit('capture-write')
+@api_login_required
+@require_scope('captures:write')
+@concurrency_limit('upload')
+async def upload_complete(request, pk):
+    """
+    Attach a file the client uploaded directly to media storage to a capture.
+
+    Expects a JSON body ``{"file": "<storage name>", "duration_seconds": <float>}``
+    where the name lies under this capture's own upload prefix, as issued by
+    ``upload_target``; files of other captures or users are refused.
+    """
+    pin_primary()
+    user = await request.auser()
+    payload = json_body(request)
+    if payload is None:
+        return error('Request body must be a JSON object.')
+    name = payload.get('file')
+    if not isinstance(name, str) or not name:
+        return error('"file" is required.')
+
+    try:
+        capture = await Capture.objects.aget(pk=pk, user=user)
+    except Capture.DoesNotExist:
+        return error('Not found.', status=404)
+    if capture.capture_type not in ('AUDIO', 'VIDEO'):
+        return error('Only audio and video captures accept uploads.')
+    if not name.startswith(upload_prefix(capture)) or '..' in name.split('/'):
+        return error('"file" is outside this capture\'s upload location.')
+
+    duration = None
+    if payload.get('duration_seconds') is not None:
+        try:
+            duration = timedelta(seconds=float(payload['duration_seconds']))
+        except (TypeError, ValueError):
+            return error('"duration_seconds" must be a number.')
+
+    storage = MediaCapture._meta.get_field('file').storage
+    try:
+        size = await sync_to_async(storage.size, thread_sensitive=False, executor=storage_executor)(name)
+    except (OSError, ObjectDoesNotExist, SuspiciousFileOperation):
+        return error('Uploaded file not found.')
+
+    # Update or insert directly: MediaCapture.save() would stat the file again.
+    fields = {'file': name, 'file_size': size, 'duration': duration}
+    if not await MediaCapture.objects.filter(capture=capture).aupdate(**fields):
+        await MediaCapture.objects.abulk_create([MediaCapture(capture=capture, **fields)])
+
+    capture.metadata['file_size'] = size
+    if duration:
+        capture.metadata['duration_seconds'] = duration.total_seconds()
+    await capture.asave(update_fields=['metadata', 'updated_at'])
+    return JsonResponse({'id': capture.pk, 'file': name, 'file_size': size, 'metadata': capture.metadata})
+
+
+def serialize_tag(tag):
+    return {'id': tag.pk, 'name': tag.name}
+
+
+@require_GET
+@rate_limit('capture-read')
+@api_login_required
+@require_scope('captures:read')
+async def tag_list(request):
+    user = await request.auser()
+    tags = [serialize_tag(tag) async for tag in Tag.objects.filter(user=user).order_by('name')]
+    return JsonResponse({'results': tags})
+
+
+@require_POST
+@rate_limit('tag-write')
+@api_login_required
+@require_scope('tags:write')
+async def tag_merge(request, pk):
+    """Merge this tag into ``{"into": <tag id>}``; the tag is deleted."""
+    pin_primary()
+    user = await request.auser()
+    payload = json_body(request)
+    if payload is None or not isinstance(payload.get('into'), int):
+        return error('"into" must be a tag id.')
+    try:
+        source = await Tag.objects.aget(pk=pk, user=user)
+        target = await Tag.objects.aget(pk=payload['into'], user=user)
+    except Tag.DoesNotExist:
+        return error('Not found.', status=404)
+    captures = await sync_to_async(merge_tags)(source, target)
+    return JsonResponse({**serialize_tag(target), 'captures': captures})
+
+
+@require_POST
+@rate_limit('tag-write')
+@api_login_required
+@require_scope('tags:write')
+async def tag_rename(request, pk):
+    """
+    Rename a tag to ``{"name": "..."}``. If another tag already has that name the
+    request fails with 409, unless ``"merge": true`` asks to merge into it.
+    """
+    pin_primary()
+    user = await request.auser()
+    payload = json_body(request)
+    if payload is None or not isinstance(payload.get('name'), str):
+        return error('"name" is required.')
+    name = payload['name'].strip()
+    max_length = Tag._meta.get_field('name').max_length
+    if not name or len(name) > max_length:
+        return error(f'"name" must be 1-{max_length} characters.')
+    try:
+        tag = await Tag.objects.aget(pk=pk, user=user)
+    except Tag.DoesNotExist:
+        return error('Not found.', status=404)
+    try:
+        tag = await sync_to_async(rename_tag)(tag, name, merge=bool(payload.get('merge')))
+    except TagConflict as exc:
+        return error(str(exc), status=409, conflict=serialize_tag(exc.tag))
+    return JsonResponse(serialize_tag(tag))
+
+
+@require_POST
+@rate_limit('tag-write')
+@api_login_required
+@require_scope('tags:write')
+async def tag_captures(request, pk):
+    """
+    Add this tag to, or remove it from, many captures at once.
+
+    Body: ``{"action": "add" | "remove", "filter": {"type", "tag", "q"}, "ids": [...]}``.
+    Captures are selected with the same ``filter`` parameters as the capture list,
+    narrowed to ``ids`` when given; at least one of the two is required.
+    """
+    pin_primary()
+    user = await request.auser()
+    payload = json_body(request)
+    if payload is None or payload.get('action') not in ('add', 'remove'):
+        return error('"action" must be "add" or "remove".')
+    if 'filter' not in payload and 'ids' not in payload:
+        return error('Select captures with "filter" and/or "ids".')
+    params = payload.get('filter') or {}
+    if not isinstance(params, dict) or not all(isinstance(v, str) for v in params.values()):
+        return error('"filter" must map parameter names to strings.')
+    ids = payload.get('ids')
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+        return error('"ids" must be a list of capture ids.')
+
+    try:
+        tag = await Tag.objects.aget(pk=pk, user=user)
+    except Tag.DoesNotExist:
+        return error('Not found.', status=404)
+    captures = filter_captures(user, params)
+    if ids is not None:
+        captures = captures.filter(pk__in=ids)
+    operation = add_tag if payload['action'] == 'add' else remove_tag
+    count = await sync_to_async(operation)(tag, captures)
+    return JsonResponse({**serialize_tag(tag), 'action': payload['action'], 'captures': count})
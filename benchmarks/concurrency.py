@@ -0,0 +1,118 @@
+"""
+Concurrent request throughput under WSGI and ASGI.
+
+Drives the capture media-URL endpoint, whose storage call is made artificially
+slow, through the full middleware stack in-process:
+
+* WSGI - a pool of ``--threads`` sync workers, each blocked for the whole
+  storage call, as with a threaded WSGI server.
+* ASGI - a single event loop serving every request concurrently, with the
+  storage call running in the executor.
+
+Usage:
+    python benchmarks/concurrency.py [--requests N] [--concurrency N] [--threads N] [--latency SECONDS]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DJANGO_ENV', 'production')
+os.environ.setdefault('DJANGO_SECRET_KEY', 'benchmark')
+os.environ.setdefault('DJANGO_ALLOWED_HOSTS', 'testserver')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from accounts.models import CustomUser  # noqa: E402
+from captures.models import Capture, MediaCapture  # noqa: E402
+
+
+def slow_storage(latency):
+    def get_presigned_url(self, expiration=3600):
+        time.sleep(latency)  # a blocking storage round trip
+        return f'/media/{self.file.name}'
+    MediaCapture.get_presigned_url = get_presigned_url
+
+
+def fixtures():
+    user = CustomUser.objects.create_user('bench@example.com', 'bench')
+    capture = Capture.objects.create(user=user, title='Memo', capture_type='AUDIO')
+    MediaCapture.objects.bulk_create([
+        MediaCapture(capture=capture, file='captures/audio/bench.mp3', file_size=1),
+    ])
+    client = Client()
+    client.force_login(user)
+    return reverse('api:capture-media', args=[capture.pk]), client.cookies
+
+
+def run_wsgi(url, cookies, requests, threads):
+    local = threading.local()
+
+    def request(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.client.cookies = cookies
+        assert local.client.get(url).status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(request, range(requests)))
+    return time.perf_counter() - start
+
+
+async def run_asgi(url, cookies, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request():
+        async with semaphore:
+            client = AsyncClient()
+            client.cookies = cookies
+            response = await client.get(url)
+            assert response.status_code == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=4, help='WSGI worker threads')
+    parser.add_argument('--latency', type=float, default=0.05, help='storage latency in seconds')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    slow_storage(args.latency)
+    url, cookies = fixtures()
+
+    # Every request comes from one user; measure the servers, not the limiters.
+    with override_settings(RATE_LIMITS={}, CONCURRENCY_LIMITS={}):
+        wsgi = run_wsgi(url, cookies, args.requests, args.threads)
+        asgi = asyncio.run(run_asgi(url, cookies, args.requests, args.concurrency))
+
+    print(f'{args.requests} requests, {args.latency * 1000:.0f} ms storage latency')
+    print(f'{"server":<28} {"seconds":>8} {"req/s":>8}')
+    print(f'{f"WSGI ({args.threads} threads)":<28} {wsgi:>8.2f} {args.requests / wsgi:>8.1f}')
+    print(f'{f"ASGI (concurrency {args.concurrency})":<28} {asgi:>8.2f} {args.requests / asgi:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
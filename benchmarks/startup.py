@@ -0,0 +1,99 @@
+"""
+Startup and per-request overhead benchmark for the settings profiles.
+
+Each sample runs in a fresh interpreter so import caches don't leak between
+runs. For every profile it reports the median of:
+
+* import  - importing the settings module and Django itself
+* setup   - ``django.setup()`` (app registry, models, admin autodiscovery)
+* urls    - loading the root URLconf
+* request - one request through the full middleware stack
+
+Usage:
+    python benchmarks/startup.py [--runs N] [--requests N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+PROFILES = {
+    'development': {'DJANGO_ENV': 'development'},
+    'production': {
+        'DJANGO_ENV': 'production',
+        'DJANGO_SECRET_KEY': 'benchmark',
+        'DJANGO_ALLOWED_HOSTS': 'testserver',
+    },
+}
+
+SAMPLE = r"""
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+t0 = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+t1 = time.perf_counter()
+django.setup()
+t2 = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t3 = time.perf_counter()
+from django.test import Client
+client = Client(REMOTE_ADDR='127.0.0.1')
+client.get('/metrics/')  # warm up
+timings = []
+for _ in range(int(sys.argv[1])):
+    start = time.perf_counter()
+    client.get('/metrics/')
+    timings.append(time.perf_counter() - start)
+timings.sort()
+print(json.dumps({
+    'import': t1 - t0,
+    'setup': t2 - t1,
+    'urls': t3 - t2,
+    'request': timings[len(timings) // 2],
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def sample(env, requests):
+    result = subprocess.run(
+        [sys.executable, '-c', SAMPLE, str(requests)],
+        cwd=BASE_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12} {'import ms':>10} {'setup ms':>10} {'urls ms':>10} {'request us':>11} {'modules':>8}")
+    for name, env in PROFILES.items():
+        samples = [sample(env, args.requests) for _ in range(args.runs)]
+        median = {
+            key: statistics.median(s[key] for s in samples)
+            for key in ('import', 'setup', 'urls', 'request', 'modules')
+        }
+        print(
+            f"{name:<12} {median['import'] * 1e3:>10.1f} {median['setup'] * 1e3:>10.1f} "
+            f"{median['urls'] * 1e3:>10.1f} {median['request'] * 1e6:>11.0f} {median['modules']:>8.0f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,25 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django import forms
 from tinymce.widgets import TinyMCE
-from .models import Capture, TextCapture, MediaCapture
+from config.paginators import EstimatedCountPaginator
+from tags.models import Tag
+from .models import Capture, TextCapture, MediaCapture, TrashedCapture
 
 class CaptureAdminForm(forms.ModelForm):
     """Base form for creating captures with type selection."""
+    tag_owner = None  # set per request by CaptureAdmin.get_form()
+
     class Meta:
         model = Capture
-        fields = ['title', 'capture_type']
+        fields = ['title', 'capture_type', 'tags']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if 'capture_type' in self.fields:
             self.fields['capture_type'].widget = forms.RadioSelect(choices=Capture.CAPTURE_TYPES)
+        if 'tags' in self.fields:
+            # Only the capture owner's tags; served by the (user, name) unique index.
+            self.fields['tags'].queryset = Tag.objects.filter(user=self.tag_owner).order_by('name')
 
 class TextCaptureInline(admin.StackedInline):
     model = TextCapture
@@ -41,10 +48,52 @@ class MediaCaptureInline(admin.StackedInline):
 class CaptureAdmin(admin.ModelAdmin):
     form = CaptureAdminForm
     list_display = ('title', 'user', 'capture_type', 'created_at')
-    list_filter = ('capture_type', 'created_at')
-    search_fields = ('title', 'user__username')
+    list_filter = ('capture_type',)
+    list_select_related = ('user',)
+    date_hierarchy = 'created_at'  # indexed
+    search_fields = ('title', '=user__email')
+    filter_horizontal = ('tags',)
     readonly_fields = ('created_at', 'updated_at')
     inlines = [TextCaptureInline, MediaCaptureInline]  # Always include both inlines
+    # Avoid exact COUNT(*)s over the whole table on every changelist page
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ['trash_selected']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # The stock delete action walks every related row to build its
+        # confirmation page; trashing is a single UPDATE.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def has_delete_permission(self, request, obj=None):
+        # No per-object delete view: its confirmation page lists every related
+        # row, yet deleting only trashes the capture. The trash action remains.
+        if obj is not None:
+            return False
+        return super().has_delete_permission(request)
+
+    @admin.action(description='Move selected captures to the trash', permissions=['delete'])
+    def trash_selected(self, request, queryset):
+        count = queryset.trash()
+        self.message_user(request, f'Moved {count} captures to the trash.')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if match and match.url_name == 'captures_capture_changelist':
+            # The changelist only shows a few columns; don't load metadata blobs.
+            queryset = queryset.select_related('user').only(
+                'title', 'capture_type', 'created_at', 'user__email'
+            )
+        return queryset
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        # A fresh class per call, so setting the owner is request-local.
+        form.tag_owner = obj.user if obj is not None else request.user
+        return form
 
     def get_formsets_with_inlines(self, request, obj=None):
         """Override to ensure proper inline initialization."""
@@ -79,3 +128,31 @@ class CaptureAdmin(admin.ModelAdmin):
             'admin/js/inlines.js',
             'captures/admin/js/dynamic-inlines.js',  # Updated path to our custom JS
         )
+
+@admin.register(TrashedCapture)
+class TrashedCaptureAdmin(admin.ModelAdmin):
+    """Read-only view of the trash; captures leave it by restore or purge_trash."""
+    list_display = ('title', 'user', 'capture_type', 'deleted_at')
+    list_filter = ('capture_type',)
+    list_select_related = ('user',)
+    search_fields = ('title', '=user__email')
+    actions = ['restore_selected']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_restore_permission(self, request):
+        return request.user.has_perm('captures.delete_capture')
+
+    @admin.action(description='Restore selected captures', permissions=['restore'])
+    def restore_selected(self, request, queryset):
+        count = queryset.restore()
+        self.message_user(request, f'Restored {count} captures.')
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from captures.purge import DEFAULT_BATCH_SIZE, purge_account
+
+
+class Command(BaseCommand):
+    help = 'Delete a user account, purging its captures, media files and sync records in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Seconds to sleep between batches, to leave room for interactive traffic.',
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}.')
+        total = purge_account(user, batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(f'Deleted {options["email"]} and {total} captures.')
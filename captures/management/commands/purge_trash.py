@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from captures.purge import DEFAULT_BATCH_SIZE, purge_trash
+
+
+class Command(BaseCommand):
+    help = 'Permanently delete trashed captures, in small batches, with their media files and sync records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=float, default=getattr(settings, 'TRASH_RETENTION_DAYS', 30),
+            help='Only purge captures trashed at least this many days ago.',
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Seconds to sleep between batches, to leave room for interactive traffic.',
+        )
+        parser.add_argument('--max-batches', type=int, default=None)
+
+    def handle(self, *args, **options):
+        total = purge_trash(
+            older_than=timedelta(days=options['older_than_days']),
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(f'Purged {total} trashed captures.')
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('captures', '0004_mediacapture_description_alter_capture_metadata_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='capture',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-19 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('captures', '0005_capture_created_at_index'),
+        ('tags', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrashedCapture',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'trashed capture',
+                'ordering': ['-deleted_at'],
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('captures.capture',),
+        ),
+        migrations.AddField(
+            model_name='capture',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='capture',
+            name='is_deleted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='capture',
+            index=models.Index(fields=['user', 'is_deleted', '-created_at'], name='capture_user_live_idx'),
+        ),
+    ]
@@ -2,28 +2,78 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.conf import settings
+from django.utils import timezone
 from django.utils.text import slugify
 from tinymce.models import HTMLField
+from asgiref.sync import sync_to_async
 import json
 import uuid
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking storage calls made from async code (stat, pre-signing) run here, so
+# slow media storage can't starve the default executor.
+storage_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'STORAGE_IO_WORKERS', 32),
+    thread_name_prefix='storage-io',
+)
+
+def upload_prefix(capture):
+    """
+    Storage directory for a capture's media.
+    Format: captures/<capture_type>/<year>/<month>/<capture id>/
+    """
+    date = capture.created_at
+    return f'captures/{capture.capture_type.lower()}/{date.year}/{date.month}/{capture.pk}/'
 
 def get_upload_path(instance, filename):
     """
     Generate a unique path for uploaded files.
-    Format: captures/<capture_type>/<year>/<month>/<uuid>.<ext>
+    Format: <upload_prefix>/<uuid>.<ext>
     """
     ext = filename.split('.')[-1].lower()
-    filename = f"{uuid.uuid4()}.{ext}"
-    capture_type = instance.capture.capture_type.lower()
-    date = instance.capture.created_at
-    return os.path.join(
-        'captures',
-        capture_type,
-        str(date.year),
-        str(date.month),
-        filename
-    )
+    return f'{upload_prefix(instance.capture)}{uuid.uuid4()}.{ext}'
+
+class CaptureQuerySet(models.QuerySet):
+    def trash(self):
+        """Move captures to the trash with a single UPDATE; purge_trash deletes them later."""
+        now = timezone.now()
+        return self.filter(is_deleted=False).update(is_deleted=True, deleted_at=now, updated_at=now)
+
+    async def atrash(self):
+        return await sync_to_async(self.trash)()
+
+    def restore(self):
+        return self.filter(is_deleted=True).update(is_deleted=False, deleted_at=None, updated_at=timezone.now())
+
+    async def arestore(self):
+        return await sync_to_async(self.restore)()
+
+    def delete(self):
+        """Soft delete. Use hard_delete() to remove rows and their dependents."""
+        count = self.trash()
+        return count, {self.model._meta.label: count}
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def hard_delete(self):
+        return super().delete()
+
+    hard_delete.alters_data = True
+
+
+class CaptureManager(models.Manager.from_queryset(CaptureQuerySet)):
+    """Excludes captures in the trash."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
+class TrashedCaptureManager(models.Manager.from_queryset(CaptureQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=True)
+
 
 class Capture(models.Model):
     """Base model for all types of captures (text, audio, video)."""
@@ -40,22 +90,56 @@ class Capture(models.Model):
     )
     title = models.CharField(max_length=200)
     capture_type = models.CharField(max_length=5, choices=CAPTURE_TYPES)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     tags = models.ManyToManyField('tags.Tag', blank=True)
     metadata = models.JSONField(default=dict)
+    is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CaptureManager()
+    all_objects = models.Manager.from_queryset(CaptureQuerySet)()
+    trashed = TrashedCaptureManager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's live captures, newest first: the default manager's query.
+            models.Index(fields=['user', 'is_deleted', '-created_at'], name='capture_user_live_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def delete(self, using=None, keep_parents=False):
+        """Move the capture to the trash."""
+        self.is_deleted = True
+        self.deleted_at = self.updated_at = timezone.now()
+        self.save(using=using, update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+        return 1, {self._meta.label: 1}
+
+    def restore(self):
+        self.is_deleted = False
+        self.deleted_at = None
+        self.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+
+    def hard_delete(self, using=None, keep_parents=False):
+        return super().delete(using=using, keep_parents=keep_parents)
+
     def save(self, *args, **kwargs):
         if not self.metadata:
             self.metadata = {}
         super().save(*args, **kwargs)
 
+class TrashedCapture(Capture):
+    """Captures in the trash, for the admin's trash view."""
+    objects = TrashedCaptureManager()
+
+    class Meta:
+        proxy = True
+        ordering = ['-deleted_at']
+        verbose_name = 'trashed capture'
+
 class TextCapture(models.Model):
     """Model for text-based captures with HTML content."""
     capture = models.OneToOneField(Capture, on_delete=models.CASCADE)
@@ -103,3 +187,9 @@ class MediaCapture(models.Model):
             except Exception as e:
                 print(f"Error generating pre-signed URL: {e}")
         return self.file.url
+
+    async def aget_presigned_url(self, expiration=3600):
+        """Async version of get_presigned_url(); storage I/O runs off the request thread."""
+        return await sync_to_async(
+            self.get_presigned_url, thread_sensitive=False, executor=storage_executor
+        )(expiration)
@@ -0,0 +1,116 @@
+"""
+Background purge of trashed captures.
+
+Deleting a capture only moves it to the trash. ``purge_trash`` (the management
+command) then removes trashed captures older than the retention period in
+small batches. Each batch is its own short transaction, so it never holds
+locks long enough to stall interactive traffic. Media files are removed from
+storage once the batch has committed.
+
+Deleting a user would cascade to all of their captures in one transaction, so
+accounts are removed with ``purge_account`` (``manage.py purge_account``),
+which purges the captures in the same batches before deleting the user.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from integrations.models import CaptureSync
+from .models import Capture, MediaCapture, TextCapture
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def purge_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Hard-delete up to ``batch_size`` captures trashed before ``cutoff``.
+
+    Returns ``(deleted capture count, media file names to remove)``.
+    """
+    return _purge_batch(Capture.all_objects.filter(is_deleted=True, deleted_at__lt=cutoff), batch_size)
+
+
+def _purge_batch(captures, batch_size):
+    with transaction.atomic():
+        ids = list(
+            captures
+            .select_for_update()  # a concurrent restore waits for the batch
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, []
+        files = list(
+            MediaCapture.objects
+            .filter(capture_id__in=ids)
+            .exclude(file='')
+            .values_list('file', flat=True)
+        )
+        # Set-based deletes of the dependents first, so the capture delete
+        # doesn't have to collect them row by row.
+        CaptureSync.objects.filter(capture_id__in=ids).delete()
+        Capture.tags.through.objects.filter(capture_id__in=ids).delete()
+        TextCapture.objects.filter(capture_id__in=ids).delete()
+        MediaCapture.objects.filter(capture_id__in=ids).delete()
+        captures.filter(pk__in=ids).hard_delete()
+    return len(ids), files
+
+
+def delete_media_files(names):
+    """Remove files from media storage, logging and skipping any that fail."""
+    storage = MediaCapture._meta.get_field('file').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.exception('Could not delete media file %s', name)
+
+
+def purge_trash(older_than=None, batch_size=DEFAULT_BATCH_SIZE, pause=0.1, max_batches=None):
+    """
+    Purge trashed captures older than ``older_than`` (default ``TRASH_RETENTION_DAYS``),
+    sleeping ``pause`` seconds between batches. Returns the number of captures deleted.
+    """
+    if older_than is None:
+        older_than = timedelta(days=getattr(settings, 'TRASH_RETENTION_DAYS', 30))
+    cutoff = timezone.now() - older_than
+    return _purge(lambda: purge_batch(cutoff, batch_size), batch_size, pause, max_batches)
+
+
+def purge_account(user, batch_size=DEFAULT_BATCH_SIZE, pause=0.1):
+    """
+    Delete ``user`` without cascading to all of their captures at once.
+
+    The account is deactivated first, which also evicts its cached API tokens.
+    Its captures, trashed or not, are then purged in batches, and finally the
+    user row is deleted, cascading only to small tables such as tags,
+    integrations and API tokens. Returns the number of captures deleted.
+    """
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    total = _purge(lambda: _purge_batch(Capture.all_objects.filter(user=user), batch_size), batch_size, pause)
+    user.delete()
+    return total
+
+
+def _purge(purge_next_batch, batch_size, pause, max_batches=None):
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        deleted, files = purge_next_batch()
+        if not deleted:
+            break
+        delete_media_files(files)
+        total += deleted
+        batches += 1
+        logger.info('Purged %d captures (%d total)', deleted, total)
+        if deleted < batch_size:
+            break
+        time.sleep(pause)
+    return total
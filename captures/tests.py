@@ -1,3 +1,208 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from integrations.models import CaptureSync, Integration
+from tags.models import Tag
+from .models import Capture, MediaCapture, TextCapture, TrashedCapture
+from .purge import purge_account, purge_trash
+
+
+class CaptureAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create_superuser('admin@example.com', 'pw')
+        cls.users = [User.objects.create_user(f'user{i}@example.com', 'pw') for i in range(5)]
+
+    def create_captures(self, count):
+        Capture.objects.bulk_create([
+            Capture(user=self.users[i % len(self.users)], title=f'Note {i}', capture_type='TEXT')
+            for i in range(count)
+        ])
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:captures_capture_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def test_changelist_query_count_independent_of_rows(self):
+        self.client.force_login(self.admin)
+        self.create_captures(2)
+        baseline = len(self.changelist_queries())
+        self.create_captures(20)
+        queries = self.changelist_queries()
+        self.assertEqual(len(queries), baseline)
+        listing = next(q['sql'] for q in queries if 'FROM "captures_capture" INNER JOIN' in q['sql'])
+        self.assertNotIn('"metadata"', listing)
+
+    def test_search_by_user_email(self):
+        self.client.force_login(self.admin)
+        Capture.objects.create(user=self.users[1], title='Mine', capture_type='TEXT')
+        response = self.client.get(
+            reverse('admin:captures_capture_changelist'), {'q': 'user1@example.com'}
+        )
+        self.assertContains(response, 'Mine')
+
+    def test_change_view_loads_text_body(self):
+        self.client.force_login(self.admin)
+        capture = Capture.objects.create(user=self.users[0], title='Note', capture_type='TEXT')
+        TextCapture.objects.create(capture=capture, content='<p>body</p>')
+        response = self.client.get(reverse('admin:captures_capture_change', args=[capture.pk]))
+        self.assertContains(response, 'body')
+
+    def test_tag_choices_are_the_owners(self):
+        self.client.force_login(self.admin)
+        capture = Capture.objects.create(user=self.users[0], title='Note', capture_type='TEXT')
+        mine = Tag.objects.create(user=self.users[0], name='ideas')
+        theirs = Tag.objects.create(user=self.users[1], name='secret')
+        url = reverse('admin:captures_capture_change', args=[capture.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'ideas (user0@example.com)')
+        self.assertNotContains(response, 'secret')
+
+        response = self.client.post(url, {
+            'title': 'Note', 'tags': [mine.pk, theirs.pk],
+            'textcapture-TOTAL_FORMS': 0, 'textcapture-INITIAL_FORMS': 0,
+        })
+        self.assertIn('tags', response.context['adminform'].form.errors)
+        self.assertFalse(capture.tags.exists())
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner@example.com', 'pw')
+        self.capture = Capture.objects.create(user=self.user, title='Note', capture_type='TEXT')
+        TextCapture.objects.create(capture=self.capture, content='<p>body</p>')
+
+    def test_delete_moves_to_trash(self):
+        self.capture.delete()
+        self.assertFalse(Capture.objects.exists())
+        self.assertFalse(self.user.captures.exists())
+        self.assertEqual(list(Capture.trashed.all()), [self.capture])
+        self.assertTrue(TextCapture.objects.filter(capture=self.capture).exists())
+
+        self.capture.restore()
+        self.assertEqual(list(Capture.objects.all()), [self.capture])
+
+    def test_queryset_delete_is_a_single_update(self):
+        with self.assertNumQueries(1):
+            count, _ = Capture.objects.filter(user=self.user).delete()
+        self.assertEqual(count, 1)
+        self.assertEqual(Capture.trashed.get().pk, self.capture.pk)
+        self.assertIsNotNone(Capture.trashed.get().deleted_at)
+
+
+class PurgeTrashTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user('owner@example.com', 'pw')
+        tag = Tag.objects.create(user=self.user, name='ideas')
+        integration = Integration.objects.create(user=self.user, integration_type='NOTION')
+        self.captures = []
+        for i in range(5):
+            capture = Capture.objects.create(user=self.user, title=f'Memo {i}', capture_type='AUDIO')
+            capture.tags.add(tag)
+            media = MediaCapture(capture=capture)
+            media.file.save('memo.mp3', ContentFile(b'data'))
+            CaptureSync.objects.create(
+                capture=capture, integration=integration, external_id=str(i),
+                last_synced=timezone.now(), sync_status='SUCCESS',
+            )
+            self.captures.append(capture)
+
+    def trash(self, captures, days_ago):
+        Capture.all_objects.filter(pk__in=[c.pk for c in captures]).update(
+            is_deleted=True, deleted_at=timezone.now() - timedelta(days=days_ago)
+        )
+
+    def test_purges_expired_trash_in_batches(self):
+        self.trash(self.captures[:3], days_ago=40)
+        self.trash(self.captures[3:4], days_ago=1)
+        files = [c.mediacapture.file.name for c in self.captures]
+
+        self.assertEqual(purge_trash(batch_size=2, pause=0), 3)
+
+        self.assertEqual(
+            set(Capture.all_objects.values_list('pk', flat=True)),
+            {c.pk for c in self.captures[3:]},
+        )
+        self.assertEqual(CaptureSync.objects.count(), 2)
+        self.assertEqual(MediaCapture.objects.count(), 2)
+        self.assertEqual(Capture.tags.through.objects.count(), 2)
+        storage = MediaCapture._meta.get_field('file').storage
+        self.assertEqual([storage.exists(name) for name in files], [False, False, False, True, True])
+
+    def test_management_command(self):
+        self.trash(self.captures, days_ago=2)
+        out = StringIO()
+        call_command('purge_trash', '--older-than-days=1', '--batch-size=10', '--pause=0', stdout=out)
+        self.assertIn('Purged 5 trashed captures.', out.getvalue())
+        self.assertFalse(Capture.all_objects.exists())
+
+    def test_purge_account(self):
+        other = get_user_model().objects.create_user('other@example.com', 'pw')
+        kept = Capture.objects.create(user=other, title='Not mine', capture_type='TEXT')
+        files = [c.mediacapture.file.name for c in self.captures]
+        self.trash(self.captures[:1], days_ago=1)
+
+        self.assertEqual(purge_account(self.user, batch_size=2, pause=0), 5)
+
+        self.assertFalse(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(list(Capture.all_objects.all()), [kept])
+        self.assertFalse(CaptureSync.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+        storage = MediaCapture._meta.get_field('file').storage
+        self.assertFalse(any(storage.exists(name) for name in files))
+
+    def test_purge_account_command(self):
+        out = StringIO()
+        call_command('purge_account', 'owner@example.com', '--pause=0', stdout=out)
+        self.assertIn('Deleted owner@example.com and 5 captures.', out.getvalue())
+
+
+class TrashAdminTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.client.force_login(User.objects.create_superuser('admin@example.com', 'pw'))
+        self.capture = Capture.objects.create(
+            user=User.objects.create_user('owner@example.com', 'pw'), title='Note', capture_type='TEXT'
+        )
+
+    def test_trash_and_restore_actions(self):
+        response = self.client.post(reverse('admin:captures_capture_changelist'), {
+            'action': 'trash_selected', '_selected_action': [self.capture.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(TrashedCapture.objects.filter(pk=self.capture.pk).exists())
+
+        response = self.client.get(reverse('admin:captures_trashedcapture_changelist'))
+        self.assertContains(response, 'Note')
+        self.client.post(reverse('admin:captures_trashedcapture_changelist'), {
+            'action': 'restore_selected', '_selected_action': [self.capture.pk],
+        })
+        self.assertTrue(Capture.objects.filter(pk=self.capture.pk).exists())
+
+    def test_no_per_object_delete_view(self):
+        response = self.client.get(reverse('admin:captures_capture_delete', args=[self.capture.pk]))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('admin:accounts_customuser_delete', args=[self.capture.user_id]))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('admin:accounts_customuser_add'))
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,376 @@
+"""
+Lightweight per-request performance instrumentation.
+
+Every request records wall time, DB query count and DB time, cache hits and
+misses and response size, aggregated in-process into histograms and exposed
+in Prometheus text format by ``metrics_view``. Metrics are per worker process;
+Prometheus sums them across workers at query time.
+"""
+
+import contextvars
+import heapq
+import hmac
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Fixed-bucket cumulative histogram, Prometheus style."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Thread-safe in-process store of counters and histograms keyed by labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, help_text, metric_type):
+        self._help[name] = (help_text, metric_type)
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=(), buckets=DURATION_BUCKETS):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.cumulative()), h.sum, h.count))
+                for key, h in self._histograms.items()
+            )
+
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name in seen:
+                return
+            seen.add(name)
+            help_text, metric_type = self._help.get(name, ('', 'untyped'))
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for (name, labels), (buckets, total, count) in histograms:
+            header(name)
+            for bound, cumulative in buckets:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels
+    )
+    return '{' + pairs + '}'
+
+
+registry = MetricsRegistry()
+registry.describe('muzebox_requests_total', 'Requests handled, by view, method and status.', 'counter')
+registry.describe('muzebox_request_duration_seconds', 'Wall time spent handling a request.', 'histogram')
+registry.describe('muzebox_db_queries', 'Database queries executed per request.', 'histogram')
+registry.describe('muzebox_db_duplicate_queries', 'Repeated identical SQL statements per request (N+1 signal).', 'histogram')
+registry.describe('muzebox_db_duration_seconds', 'Time spent in the database per request.', 'histogram')
+registry.describe('muzebox_response_size_bytes', 'Response body size.', 'histogram')
+registry.describe('muzebox_cache_hits_total', 'Cache hits, by view.', 'counter')
+registry.describe('muzebox_cache_misses_total', 'Cache misses, by view.', 'counter')
+
+
+class RequestStats:
+    """Per-request counters filled in by the DB and cache hooks."""
+
+    __slots__ = ('keep', 'queries', 'db_time', 'cache_hits', 'cache_misses', 'statements', 'worst')
+
+    def __init__(self, keep=5):
+        self.keep = keep
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.statements = Counter()
+        self.worst = []  # min-heap of (duration, sql), bounded
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.statements[sql] += 1
+        if len(self.worst) < self.keep:
+            heapq.heappush(self.worst, (duration, sql))
+        elif duration > self.worst[0][0]:
+            heapq.heapreplace(self.worst, (duration, sql))
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+
+_current_stats = contextvars.ContextVar('muzebox_request_stats', default=None)
+
+
+def current_stats():
+    """Return the ``RequestStats`` of the request being handled, if any."""
+    return _current_stats.get()
+
+
+def record_cache_access(hits=0, misses=0):
+    """Attribute cache hits and misses to the current request."""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+class InstrumentedCacheMixin:
+    """
+    Mixin for cache backends that reports hits and misses to the current request.
+    Combine it with any backend, e.g. ``class Cache(InstrumentedCacheMixin, RedisCache)``.
+    """
+
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version=version)
+        if value is self._missing:
+            record_cache_access(misses=1)
+            return default
+        record_cache_access(hits=1)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        # BaseCache.get_many() falls back to get(); don't count those twice.
+        token = _current_stats.set(None)
+        try:
+            found = super().get_many(keys, version=version)
+        finally:
+            _current_stats.reset(token)
+        record_cache_access(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+
+def _time_query(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` hook attributing each query to the current request."""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record_query(sql, time.perf_counter() - start)
+
+
+def install_query_timer(connection, **kwargs):
+    """
+    Install the query hook on ``connection`` for its whole lifetime.
+
+    Connections are per thread and, under ASGI, concurrent requests can share the
+    thread the async ORM runs in, so the hook finds its request through a context
+    variable rather than being installed per request.
+    """
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(install_query_timer)
+for _connection in connections.all(initialized_only=True):
+    install_query_timer(_connection)
+
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name  # falls back to the view's dotted path when unnamed
+
+
+def _response_size(response):
+    if getattr(response, 'streaming', False):
+        length = response.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+    return len(response.content)
+
+
+class InstrumentationMiddleware:
+    """
+    Record per-view request metrics and log slow requests with their worst queries.
+
+    Place it near the top of ``MIDDLEWARE`` so the timings include the rest of the
+    stack. Thresholds come from ``SLOW_REQUEST_THRESHOLD`` (seconds) and
+    ``SLOW_REQUEST_WORST_QUERIES``.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', 1.0)
+        self.worst_queries = getattr(settings, 'SLOW_REQUEST_WORST_QUERIES', 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(self.worst_queries)
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats(self.worst_queries)
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, duration):
+        view = _view_label(request)
+        labels = (('view', view),)
+        registry.inc('muzebox_requests_total', labels + (
+            ('method', request.method), ('status', response.status_code),
+        ))
+        registry.observe('muzebox_request_duration_seconds', duration, labels)
+        registry.observe('muzebox_db_queries', stats.queries, labels, QUERY_COUNT_BUCKETS)
+        registry.observe('muzebox_db_duplicate_queries', stats.duplicate_queries, labels, QUERY_COUNT_BUCKETS)
+        registry.observe('muzebox_db_duration_seconds', stats.db_time, labels)
+        size = _response_size(response)
+        if size is not None:
+            registry.observe('muzebox_response_size_bytes', size, labels, SIZE_BUCKETS)
+        if stats.cache_hits:
+            registry.inc('muzebox_cache_hits_total', labels, stats.cache_hits)
+        if stats.cache_misses:
+            registry.inc('muzebox_cache_misses_total', labels, stats.cache_misses)
+
+        if duration >= self.slow_threshold:
+            self.log_slow_request(request, response, stats, duration, view)
+
+    def log_slow_request(self, request, response, stats, duration, view):
+        entry = {
+            'event': 'slow_request',
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': stats.queries,
+            'db_duplicate_queries': stats.duplicate_queries,
+            'db_time_ms': round(stats.db_time * 1000, 2),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+            'worst_queries': [
+                {'duration_ms': round(d * 1000, 2), 'sql': sql}
+                for d, sql in sorted(stats.worst, reverse=True)
+            ],
+            'repeated_queries': [
+                {'count': count, 'sql': sql}
+                for sql, count in stats.statements.most_common(self.worst_queries)
+                if count > 1
+            ],
+        }
+        logger.warning(json.dumps(entry), extra={'performance': entry})
+
+
+def metrics_view(request):
+    """
+    Expose the metrics registry in Prometheus text format.
+
+    Access requires ``Authorization: Bearer <METRICS_TOKEN>`` when ``METRICS_TOKEN``
+    is set. Without it, development allows requests from ``INTERNAL_IPS`` and
+    production allows nothing: behind a local reverse proxy every request
+    comes from an internal address.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = hmac.compare_digest(
+            request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+        )
+    elif getattr(settings, 'PRODUCTION', False):
+        allowed = False
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
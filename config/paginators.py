@@ -0,0 +1,45 @@
+"""
+Paginators for tables too large to ``COUNT(*)`` on every page view.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count never scans more than ``count_cap`` rows.
+
+    An unfiltered PostgreSQL table reports the planner's row estimate. Anything
+    else is counted with ``SELECT COUNT(*) FROM (... LIMIT count_cap)``, so the
+    page links stop at the cap instead of counting millions of rows.
+    """
+
+    count_cap = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        estimate = self.estimate(queryset)
+        if estimate is not None and estimate > self.count_cap:
+            return estimate
+        return queryset[:self.count_cap].count()
+
+    def estimate(self, queryset):
+        """Planner row estimate for an unfiltered queryset, or ``None``."""
+        if queryset.query.where or queryset.query.distinct:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been vacuumed or analyzed.
+        return row[0] if row and row[0] >= 0 else None
@@ -0,0 +1,256 @@
+"""
+Rate limiting and concurrency limits for API endpoints.
+
+``rate_limit(scope)`` checks token buckets configured in ``RATE_LIMITS``: one
+per client and optionally one shared by everyone for the scope. It runs before
+authentication, so a client is the user of a verified API token, else the
+session cookie, else the client IP (``client_ip``, which honours
+``RATE_LIMIT_PROXY_COUNT`` behind reverse proxies). The cookie is hashed but
+not verified, since resolving the session would cost the queries limiting is
+meant to shed; a client inventing cookies is held back by the scope's global
+bucket. Buckets live in the default cache. They are shared by every worker only
+with a shared backend (``DJANGO_REDIS_URL``); with the in-memory default each
+process has its own buckets, so N workers allow up to N times the rate. If the
+cache is unavailable they fall back to in-process buckets.
+
+``concurrency_limit(scope)`` caps simultaneous requests per worker process
+with ``CONCURRENCY_LIMITS``; streaming responses hold their slot until closed.
+
+Both reject with ``429 Too Many Requests`` and a ``Retry-After`` header, before
+the view touches the database, and count their decisions in the metrics
+registry.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from config.instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+registry.describe('muzebox_ratelimit_decisions_total', 'Rate and concurrency limiter decisions, by scope.', 'counter')
+
+
+def parse_rate(rate):
+    """Parse ``'<requests>/<s|m|h>'`` into ``(tokens per second, capacity)``."""
+    count, period = rate.split('/')
+    count = int(count)
+    return count / PERIODS[period], count
+
+
+class LocalBucketStore:
+    """In-process bucket storage, used when the cache backend fails."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def get(self, key):
+        with self._lock:
+            return self._buckets.get(key)
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._buckets[key] = value
+
+
+local_buckets = LocalBucketStore()
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at ``rate`` tokens per second, up to ``capacity``.
+
+    State is ``(tokens, timestamp)`` under ``key``. The read-modify-write isn't
+    atomic across workers, so a burst of simultaneous requests can overshoot
+    slightly; that's acceptable for shedding load.
+    """
+
+    def __init__(self, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def consume(self, now=None):
+        """Take a token. Return 0 if allowed, else the seconds until one is available."""
+        now = time.time() if now is None else now
+        timeout = math.ceil(self.capacity / self.rate) + 1
+        try:
+            return self._consume(cache, now, timeout)
+        except Exception:
+            logger.warning('Rate limit cache unavailable; using in-process buckets', exc_info=True)
+            return self._consume(local_buckets, now, timeout)
+
+    def _consume(self, store, now, timeout):
+        state = store.get(self.key)
+        tokens, updated = state if state else (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            store.set(self.key, (tokens - 1, now), timeout)
+            return 0
+        store.set(self.key, (tokens, now), timeout)
+        return (1 - tokens) / self.rate
+
+
+def client_ip(request):
+    """
+    The client address. With ``RATE_LIMIT_PROXY_COUNT`` trusted proxies in
+    front, it's the entry they appended to ``X-Forwarded-For``; anything
+    further left is client-supplied.
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_identity(request):
+    """The bucket key for a request, known without touching the database."""
+    principal = getattr(request, 'api_token', None)  # set by TokenAuthenticationMiddleware
+    if principal is not None:
+        return f'user:{principal.user.pk}'
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        return f'session:{hashlib.sha256(session_key.encode()).hexdigest()[:32]}'
+    return f'ip:{client_ip(request)}'
+
+
+def check_rate(scope, identity):
+    """Consume from the scope's buckets; return the Retry-After in seconds, or 0."""
+    config = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    if not config:
+        return 0
+    buckets = []
+    if 'user' in config:
+        buckets.append(TokenBucket(f'ratelimit:{scope}:{identity}', *parse_rate(config['user'])))
+    if 'global' in config:
+        buckets.append(TokenBucket(f'ratelimit:{scope}', *parse_rate(config['global'])))
+    retry_after = 0
+    for bucket in buckets:
+        retry_after = max(retry_after, bucket.consume())
+        if retry_after:
+            break
+    return retry_after
+
+
+def throttled(scope, decision, retry_after):
+    registry.inc('muzebox_ratelimit_decisions_total', (('scope', scope), ('decision', decision)))
+    response = JsonResponse({'detail': 'Request was throttled.'}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def allowed(scope):
+    registry.inc('muzebox_ratelimit_decisions_total', (('scope', scope), ('decision', 'allowed')))
+
+
+def rate_limit(scope):
+    """
+    Throttle a view with the token buckets configured for ``scope`` in ``RATE_LIMITS``.
+    Apply it outside the authentication decorators.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                # Off the ORM thread, so a slow cache never queues behind queries.
+                retry_after = await sync_to_async(check_rate, thread_sensitive=False)(
+                    scope, client_identity(request)
+                )
+                if retry_after:
+                    return throttled(scope, 'rate_limited', retry_after)
+                allowed(scope)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                retry_after = check_rate(scope, client_identity(request))
+                if retry_after:
+                    return throttled(scope, 'rate_limited', retry_after)
+                allowed(scope)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ConcurrencySlots:
+    """Non-blocking per-process counter of in-flight requests for each scope."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def acquire(self, scope, limit):
+        with self._lock:
+            if self._in_flight.get(scope, 0) >= limit:
+                return False
+            self._in_flight[scope] = self._in_flight.get(scope, 0) + 1
+            return True
+
+    def release(self, scope):
+        with self._lock:
+            self._in_flight[scope] -= 1
+
+
+slots = ConcurrencySlots()
+
+
+def _hold_until_closed(response, scope):
+    if response.streaming:
+        # Streaming bodies are produced after the view returns; release the slot
+        # when the server closes the response.
+        response._resource_closers.append(lambda: slots.release(scope))
+    else:
+        slots.release(scope)
+    return response
+
+
+def concurrency_limit(scope):
+    """Cap in-flight requests of a view per process with ``CONCURRENCY_LIMITS[scope]``."""
+    def decorator(view):
+        def limit():
+            return getattr(settings, 'CONCURRENCY_LIMITS', {}).get(scope)
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                max_in_flight = limit()
+                if max_in_flight is None:
+                    return await view(request, *args, **kwargs)
+                if not slots.acquire(scope, max_in_flight):
+                    return throttled(scope, 'concurrency_limited', 1)
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    slots.release(scope)
+                    raise
+                return _hold_until_closed(response, scope)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                max_in_flight = limit()
+                if max_in_flight is None:
+                    return view(request, *args, **kwargs)
+                if not slots.acquire(scope, max_in_flight):
+                    return throttled(scope, 'concurrency_limited', 1)
+                try:
+                    response = view(request, *args, **kwargs)
+                except BaseException:
+                    slots.release(scope)
+                    raise
+                return _hold_until_closed(response, scope)
+        return wrapper
+    return decorator
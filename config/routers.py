@@ -0,0 +1,119 @@
+"""
+Primary/replica database routing.
+
+Reads go to one of the aliases in ``DATABASE_REPLICAS``, the same one for the
+whole request so its reads see a consistent replication lag; writes always go
+to ``default``. Once a request writes, every later read in that request is pinned
+to the primary so it sees its own writes, and ``ReplicaPinningMiddleware``
+keeps the client pinned for ``REPLICA_PIN_SECONDS`` afterwards to cover
+replication lag across redirects. With no replicas configured everything goes
+to ``default``.
+"""
+
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+
+_pinned = contextvars.ContextVar('muzebox_db_pinned', default=False)
+_wrote = contextvars.ContextVar('muzebox_db_wrote', default=False)
+_replica = contextvars.ContextVar('muzebox_db_replica', default=None)
+
+
+def pin_primary():
+    """Route the rest of the current request's reads to the primary."""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def use_primary():
+    """Temporarily route reads to the primary, e.g. for read-modify-write code."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not replicas or _pinned.get():
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction on the primary must see that transaction.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replica = _replica.get()
+        if replica not in replicas:
+            replica = random.choice(replicas)
+            _replica.set(replica)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', ())}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Scope primary pinning to a request, and carry it over to the client's next
+    requests for ``REPLICA_PIN_SECONDS`` after a write.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pinned = _pinned.set(PIN_COOKIE in request.COOKIES)
+        wrote = _wrote.set(False)
+        replica = _replica.set(None)  # chosen by the request's first read
+        try:
+            response = self.get_response(request)
+            did_write = _wrote.get()
+        finally:
+            _pinned.reset(pinned)
+            _wrote.reset(wrote)
+            _replica.reset(replica)
+        return self.process_response(response, did_write)
+
+    async def __acall__(self, request):
+        pinned = _pinned.set(PIN_COOKIE in request.COOKIES)
+        wrote = _wrote.set(False)
+        replica = _replica.set(None)  # chosen by the request's first read
+        try:
+            response = await self.get_response(request)
+            did_write = _wrote.get()
+        finally:
+            _pinned.reset(pinned)
+            _wrote.reset(wrote)
+            _replica.reset(replica)
+        return self.process_response(response, did_write)
+
+    def process_response(self, response, did_write):
+        pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 0)
+        if did_write and pin_seconds and getattr(settings, 'DATABASE_REPLICAS', ()):
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds, httponly=True, samesite='Lax')
+        return response
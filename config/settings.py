@@ -10,22 +10,40 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
+from config.db import sqlite_options
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-# Quick-start development settings - unsuitable for production
+# Settings profile, selected with the DJANGO_ENV environment variable.
+# 'development' (the default) enables debug tooling; 'production' drops every
+# dev-only app and middleware so they are never imported.
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
+ENVIRONMENT = os.environ.get('DJANGO_ENV', 'development')
+if ENVIRONMENT not in ('development', 'production'):
+    raise ImproperlyConfigured(
+        f"DJANGO_ENV must be 'development' or 'production', not {ENVIRONMENT!r}."
+    )
+PRODUCTION = ENVIRONMENT == 'production'
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-_ac$cks+0e9!mwoo_0mi-g0-rm7h1-bx+9^#xj84(9lk=kwo$^'
+if PRODUCTION:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+else:
+    SECRET_KEY = 'django-insecure-_ac$cks+0e9!mwoo_0mi-g0-rm7h1-bx+9^#xj84(9lk=kwo$^'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host
+]
 
 
 # Application definition
@@ -42,9 +60,7 @@ INSTALLED_APPS = [
     # Third-party apps
     'tailwind',
     'theme',
-    'django_browser_reload',
     'rest_framework',
-    'debug_toolbar',
     'tinymce',
 
     # Local apps
@@ -53,21 +69,36 @@ INSTALLED_APPS = [
     'tags',
     'integrations',
     'api',
-    
 ]
 
 MIDDLEWARE = [
+    'config.instrumentation.InstrumentationMiddleware',
+    'config.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.authentication.TokenAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django_browser_reload.middleware.BrowserReloadMiddleware',
 ]
 
+# Dev-only tooling. Never installed in production, so neither the apps nor
+# their middleware are imported there.
+DEV_APPS = [
+    'django_browser_reload',
+    'debug_toolbar',
+]
+
+if not PRODUCTION:
+    INSTALLED_APPS += DEV_APPS
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'debug_toolbar.middleware.DebugToolbarMiddleware',
+    )
+    MIDDLEWARE.append('django_browser_reload.middleware.BrowserReloadMiddleware')
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -77,7 +108,6 @@ TEMPLATES = [
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
-                'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
@@ -86,6 +116,20 @@ TEMPLATES = [
     },
 ]
 
+if PRODUCTION:
+    # Parse templates once per process instead of on every render.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+else:
+    TEMPLATES[0]['OPTIONS']['context_processors'].insert(
+        0, 'django.template.context_processors.debug'
+    )
+
 WSGI_APPLICATION = 'config.wsgi.application'
 
 
@@ -96,9 +140,59 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': sqlite_options(),
     }
 }
 
+# Read replicas, as a comma-separated list of SQLite files. Locally, copies
+# of db.sqlite3 are enough to exercise the routing.
+# Replicas are read-only connections; BEGIN IMMEDIATE would fail on them.
+REPLICA_OPTIONS = sqlite_options(pragmas={'query_only': 'ON'}, transaction_mode='DEFERRED')
+DATABASE_REPLICAS = []
+for index, path in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICAS', '').split(','))):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': REPLICA_OPTIONS,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['config.routers.PrimaryReplicaRouter']
+
+# After a write, keep the client's reads on the primary for this long (seconds).
+REPLICA_PIN_SECONDS = 5
+
+if PRODUCTION:
+    # Persistent connections, checked before reuse, are opt-in: they pay off
+    # under WSGI, but under ASGI (which the async API is meant for) each
+    # request's ORM thread opens its own connection, which then lingers.
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = int(os.environ.get('DJANGO_CONN_MAX_AGE', 0))
+        database['CONN_HEALTH_CHECKS'] = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# Rate-limit buckets and cached API token principals live here, so with more
+# than one worker process set DJANGO_REDIS_URL (e.g. redis://localhost:6379/0)
+# to share them. The in-memory default is per process.
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'config.instrumentation.InstrumentedRedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'config.instrumentation.InstrumentedLocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -132,6 +226,48 @@ USE_TZ = True
 
 INTERNAL_IPS = ['127.0.0.1']
 
+# Performance instrumentation (config.instrumentation)
+SLOW_REQUEST_THRESHOLD = 1.0  # seconds
+SLOW_REQUEST_WORST_QUERIES = 5
+# /metrics/ requires "Authorization: Bearer <token>"; without a token it is
+# only open to INTERNAL_IPS in development and closed in production.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Rate limiting (config.ratelimit). Rates are "<requests>/<s|m|h>"; a bucket
+# holds one period's worth of requests, which is the largest allowed burst.
+# 'user' buckets are per API token user, session cookie or client IP;
+# 'global' ones are shared by all clients.
+RATE_LIMITS = {
+    'capture-read': {'user': '600/m'},
+    'capture-sync': {'user': '120/m'},
+    'capture-write': {'user': '60/m', 'global': '50/s'},
+    'capture-export': {'user': '10/h'},
+    'tag-write': {'user': '30/m'},
+    # API token lookups that miss the cache, per client IP.
+    'api-token-lookup': {'user': '60/m'},
+}
+
+# Reverse proxies in front of the app that append to X-Forwarded-For; the
+# client IP used for rate limiting is the entry the outermost one added.
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('DJANGO_PROXY_COUNT', 0))
+
+# Simultaneous requests per worker process.
+CONCURRENCY_LIMITS = {
+    'upload': 8,
+    'export': 2,
+}
+
+# API tokens (api.authentication): how long a verified token and its user are
+# cached, how long an unknown or inactive key is, and how often last-used
+# timestamps are written, in seconds.
+API_TOKEN_CACHE_TTL = 60
+API_TOKEN_REJECTED_CACHE_TTL = 10
+API_TOKEN_LAST_USED_INTERVAL = 60
+
+# Days a deleted capture stays in the trash before `manage.py purge_trash`
+# removes it for good.
+TRASH_RETENTION_DAYS = 30
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
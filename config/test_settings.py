@@ -0,0 +1,24 @@
+"""
+Settings for the test suite: the regular settings plus a read-only
+``replica1`` alias mirroring the test database, so routing can be tested
+against a real second SQLite connection. Tests opt into routing to it with
+``override_settings(DATABASE_REPLICAS=['replica1'])``.
+
+``manage.py test`` uses this module; other runners should set
+``DJANGO_SETTINGS_MODULE=config.test_settings``.
+"""
+
+from config.settings import *  # noqa: F401,F403
+from config.settings import BASE_DIR, DATABASES, REPLICA_OPTIONS
+
+# A new dict: test discovery also imports this module, and must not change
+# the regular settings' DATABASES.
+DATABASES = {
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': REPLICA_OPTIONS,
+        'TEST': {'MIRROR': 'default'},
+    },
+    **DATABASES,
+}
@@ -0,0 +1,327 @@
+import json
+import os
+import subprocess
+import sys
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from config.db import sqlite_options
+from config.instrumentation import InstrumentationMiddleware, registry
+from config.paginators import EstimatedCountPaginator
+from config.ratelimit import TokenBucket, client_identity, concurrency_limit, local_buckets, rate_limit, slots
+from config.routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinningMiddleware, use_primary
+
+
+class InstrumentationMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def run_view(self, view):
+        middleware = InstrumentationMiddleware(view)
+        return middleware(self.factory.get('/captures/'))
+
+    def test_records_queries_cache_and_size(self):
+        User = get_user_model()
+
+        def view(request):
+            for _ in range(3):
+                User.objects.filter(email='a@example.com').exists()
+            cache.get('missing')
+            cache.set('present', 1)
+            cache.get('present')
+            cache.get_many(['present', 'other'])
+            return HttpResponse('x' * 10)
+
+        self.run_view(view)
+        output = registry.render()
+        self.assertIn('muzebox_requests_total{view="<unresolved>",method="GET",status="200"} 1', output)
+        self.assertIn('muzebox_db_queries_sum{view="<unresolved>"} 3', output)
+        self.assertIn('muzebox_db_duplicate_queries_sum{view="<unresolved>"} 2', output)
+        self.assertIn('muzebox_response_size_bytes_sum{view="<unresolved>"} 10', output)
+        self.assertIn('muzebox_cache_hits_total{view="<unresolved>"} 2', output)
+        self.assertIn('muzebox_cache_misses_total{view="<unresolved>"} 2', output)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_logs_worst_queries(self):
+        User = get_user_model()
+
+        def view(request):
+            User.objects.count()
+            return HttpResponse()
+
+        with self.assertLogs('config.instrumentation', level='WARNING') as logs:
+            self.run_view(view)
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['event'], 'slow_request')
+        self.assertEqual(entry['db_queries'], 1)
+        self.assertIn('COUNT', entry['worst_queries'][0]['sql'])
+
+
+class MetricsViewTests(TestCase):
+    def test_internal_ip_allowed(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def test_external_ip_forbidden(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(PRODUCTION=True, METRICS_TOKEN=None)
+    def test_production_requires_token(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+
+class ProductionProfileTests(SimpleTestCase):
+    def run_settings(self, script, **env):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings', **env}
+        return subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True,
+        )
+
+    def test_dev_tooling_never_imported(self):
+        script = (
+            'import sys, django; django.setup();'
+            'from django.urls import get_resolver; get_resolver().url_patterns;'
+            'from django.conf import settings;'
+            'print(settings.DEBUG, any(m.startswith(("debug_toolbar", "django_browser_reload")) for m in sys.modules))'
+        )
+        result = self.run_settings(script, DJANGO_ENV='production', DJANGO_SECRET_KEY='test')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), 'False False')
+
+    def test_unknown_environment_is_rejected(self):
+        result = self.run_settings('import django; django.setup()', DJANGO_ENV='prod')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured', result.stderr)
+
+
+class SQLiteOptionsTests(TestCase):
+    def test_pragmas_applied_to_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_overrides(self):
+        options = sqlite_options(pragmas={'synchronous': 'FULL'}, timeout=30)
+        self.assertIn('PRAGMA synchronous=FULL', options['init_command'])
+        self.assertIn('PRAGMA journal_mode=WAL', options['init_command'])
+        self.assertEqual(options['timeout'], 30)
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+class PrimaryReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        User = get_user_model()
+        self.model = User
+
+    def route(self, request, view):
+        return ReplicaPinningMiddleware(view)(request)
+
+    def read_outside_transaction(self):
+        # TestCase wraps every test in a transaction on the primary.
+        atomic = connection.in_atomic_block
+        connection.in_atomic_block = False
+        try:
+            return self.router.db_for_read(self.model)
+        finally:
+            connection.in_atomic_block = atomic
+
+    def test_reads_go_to_replica_until_a_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.read_outside_transaction())
+            self.router.db_for_write(self.model)
+            seen.append(self.read_outside_transaction())
+            return HttpResponse()
+
+        response = self.route(self.factory.get('/'), view)
+        self.assertEqual(seen, ['replica1', 'default'])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+    def test_pin_cookie_keeps_reads_on_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        seen = []
+
+        def view(request):
+            seen.append(self.read_outside_transaction())
+            return HttpResponse()
+
+        response = self.route(request, view)
+        self.assertEqual(seen, ['default'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+    def test_one_replica_per_request(self):
+        seen = []
+
+        def view(request):
+            seen.append({self.read_outside_transaction() for _ in range(5)})
+            return HttpResponse()
+
+        with mock.patch('config.routers.random.choice', side_effect=['replica1', 'replica2']):
+            self.route(self.factory.get('/'), view)
+            self.route(self.factory.get('/'), view)
+        self.assertEqual(seen, [{'replica1'}, {'replica2'}])
+
+    def test_reads_in_transaction_and_use_primary(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_read(self.model), 'default')
+            with use_primary():
+                self.assertEqual(self.read_outside_transaction(), 'default')
+            self.assertEqual(self.read_outside_transaction(), 'replica1')
+            return HttpResponse()
+
+        self.route(self.factory.get('/'), view)
+
+
+HAS_TEST_REPLICA = 'replica1' in settings.DATABASES  # added by config.test_settings
+
+
+@skipUnless(HAS_TEST_REPLICA, 'needs the replica alias from config.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing against a real second SQLite connection, opened read-only."""
+    databases = {'default', 'replica1'} if HAS_TEST_REPLICA else {'default'}
+
+    def route(self, view):
+        return ReplicaPinningMiddleware(view)(RequestFactory().get('/'))
+
+    def test_reads_use_replica_until_the_request_writes(self):
+        User = get_user_model()
+
+        def write_then_read(request):
+            User.objects.create_user('reader@example.com', 'pw')
+            return HttpResponse(User.objects.get(email='reader@example.com')._state.db)
+
+        def read(request):
+            return HttpResponse(User.objects.get(email='reader@example.com')._state.db)
+
+        response = self.route(write_then_read)
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.route(read).content, b'replica1')
+
+    def test_replica_connection_is_read_only(self):
+        with self.assertRaises(OperationalError):
+            with connections['replica1'].cursor() as cursor:
+                cursor.execute('DELETE FROM accounts_customuser')
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def test_count_is_capped(self):
+        User = get_user_model()
+        User.objects.bulk_create([User(email=f'u{i}@example.com') for i in range(7)])
+
+        class Paginator(EstimatedCountPaginator):
+            count_cap = 5
+
+        users = User.objects.order_by('pk')
+        self.assertEqual(Paginator(users, 2).count, 5)
+        self.assertEqual(Paginator(users, 2).num_pages, 3)
+        self.assertEqual(Paginator(users.filter(email='u1@example.com'), 2).count, 1)
+        self.assertEqual(Paginator(list(users), 2).count, 7)
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket('test-bucket', rate=1, capacity=2)
+        self.assertEqual(bucket.consume(now=100), 0)
+        self.assertEqual(bucket.consume(now=100), 0)
+        self.assertAlmostEqual(bucket.consume(now=100.25), 0.75)
+        self.assertEqual(bucket.consume(now=101.5), 0)
+
+    def test_falls_back_to_local_buckets(self):
+        bucket = TokenBucket('test-fallback', rate=1, capacity=1)
+        with mock.patch('config.ratelimit.cache.get', side_effect=ConnectionError):
+            with self.assertLogs('config.ratelimit', level='WARNING'):
+                self.assertEqual(bucket.consume(now=100), 0)
+        self.assertEqual(local_buckets.get('test-fallback'), (0, 100))
+
+
+@override_settings(RATE_LIMITS={'test': {'user': '2/m'}}, CONCURRENCY_LIMITS={'test': 1})
+class LimitDecoratorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.factory = RequestFactory()
+
+    def request(self):
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1')
+        request.user = AnonymousUser()
+        return request
+
+    def test_rate_limit_rejects_with_retry_after(self):
+        view = rate_limit('test')(lambda request: HttpResponse())
+        self.assertEqual(view(self.request()).status_code, 200)
+        self.assertEqual(view(self.request()).status_code, 200)
+        response = view(self.request())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        output = registry.render()
+        self.assertIn('muzebox_ratelimit_decisions_total{scope="test",decision="allowed"} 2', output)
+        self.assertIn('muzebox_ratelimit_decisions_total{scope="test",decision="rate_limited"} 1', output)
+
+    def test_client_identity(self):
+        request = self.factory.get('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(client_identity(request), 'ip:127.0.0.1')
+        with override_settings(RATE_LIMIT_PROXY_COUNT=1):
+            self.assertEqual(client_identity(request), 'ip:203.0.113.7')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'abc'
+        self.assertTrue(client_identity(request).startswith('session:'))
+        self.assertNotIn('abc', client_identity(request))
+
+    def test_unconfigured_scope_is_unlimited(self):
+        view = rate_limit('other')(lambda request: HttpResponse())
+        for _ in range(5):
+            self.assertEqual(view(self.request()).status_code, 200)
+
+    def test_concurrency_limit_holds_slot_while_streaming(self):
+        view = concurrency_limit('test')(lambda request: StreamingHttpResponse(iter([b'x'])))
+        response = view(self.request())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(view(self.request()).status_code, 429)
+        response.close()
+        response = view(self.request())
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(slots._in_flight['test'], 0)
+
+    def test_concurrency_limit_releases_on_error(self):
+        def view(request):
+            raise ValueError
+
+        view = concurrency_limit('test')(view)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                view(self.request())
+        self.assertEqual(slots._in_flight['test'], 0)
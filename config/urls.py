@@ -1,10 +1,20 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from debug_toolbar.toolbar import debug_toolbar_urls
+from config.instrumentation import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/', include('api.urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('tinymce/', include('tinymce.urls')),
-    path("__reload__/", include("django_browser_reload.urls")),
-] + debug_toolbar_urls()
+    path('metrics/', metrics_view, name='metrics'),
+]
+
+if not settings.PRODUCTION:
+    # Imported lazily so dev tooling never loads in production.
+    from debug_toolbar.toolbar import debug_toolbar_urls
+
+    urlpatterns += [
+        path("__reload__/", include("django_browser_reload.urls")),
+    ] + debug_toolbar_urls()
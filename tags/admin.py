@@ -1,8 +1,13 @@
 from django.contrib import admin
+from config.paginators import EstimatedCountPaginator
 from .models import Tag
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'created_at')
-    search_fields = ('name', 'user__username')
+    list_select_related = ('user',)
+    search_fields = ('name', '=user__email')
+    autocomplete_fields = ('user',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
 
 admin.site.register(Tag, TagAdmin)
@@ -14,3 +14,6 @@ class Tag(models.Model):
     class Meta:
         unique_together = ['user', 'name']
 
+    def __str__(self):
+        return f'{self.name} ({self.user.email})'
+
@@ -1,3 +1,110 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import QuerySet
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from captures.models import Capture
+from . import operations
+from .models import Tag
+from .operations import TagConflict, add_tag, merge_tags, remove_tag, rename_tag
+
+
+class TagOperationTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('owner@example.com', 'pw')
+        self.other = User.objects.create_user('other@example.com', 'pw')
+        self.work = Tag.objects.create(user=self.user, name='work')
+        self.job = Tag.objects.create(user=self.user, name='job')
+        self.captures = Capture.objects.bulk_create([
+            Capture(user=self.user, title=f'Note {i}', capture_type='TEXT') for i in range(6)
+        ])
+
+    def tag_names(self, capture):
+        return sorted(capture.tags.values_list('name', flat=True))
+
+    def test_merge_moves_links_without_duplicates(self):
+        self.captures[0].tags.add(self.work)
+        self.captures[1].tags.add(self.work, self.job)
+        self.captures[2].tags.add(self.job)
+
+        self.assertEqual(merge_tags(self.work, self.job), 2)
+
+        self.assertFalse(Tag.objects.filter(pk=self.work.pk).exists())
+        self.assertEqual([self.tag_names(c) for c in self.captures[:3]], [['job'], ['job'], ['job']])
+
+    def test_merge_retries_after_a_concurrent_add(self):
+        self.captures[0].tags.add(self.work)
+        real_update = QuerySet.update
+        repoints = []
+
+        def racing_update(queryset, **kwargs):
+            if queryset.model is not operations.CaptureTag:
+                return real_update(queryset, **kwargs)
+            repoints.append(kwargs)
+            if len(repoints) > 1:
+                return real_update(queryset, **kwargs)
+            # add_tag() links the capture to the target after the exclude()
+            # was evaluated, so the UPDATE collides with it.
+            stale = operations.CaptureTag.objects.filter(pk__in=list(queryset.values_list('pk', flat=True)))
+            self.captures[0].tags.add(self.job)
+            return real_update(stale, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            self.assertEqual(merge_tags(self.work, self.job), 1)
+        self.assertEqual(len(repoints), 2)
+        self.assertEqual(self.tag_names(self.captures[0]), ['job'])
+        self.assertFalse(Tag.objects.filter(pk=self.work.pk).exists())
+
+    def test_rename_collision(self):
+        self.captures[0].tags.add(self.work)
+        with self.assertRaises(TagConflict) as cm:
+            rename_tag(self.work, 'job')
+        self.assertEqual(cm.exception.tag, self.job)
+
+        self.assertEqual(rename_tag(self.work, 'job', merge=True), self.job)
+        self.assertEqual(self.tag_names(self.captures[0]), ['job'])
+
+        self.assertEqual(rename_tag(self.job, ' career ').name, 'career')
+        self.assertEqual(self.tag_names(self.captures[0]), ['career'])
+
+    def test_bulk_add_and_remove_use_constant_queries(self):
+        self.captures[0].tags.add(self.work)
+        Capture.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        with self.assertNumQueries(5):  # savepoint, select ids, touch, insert, release
+            self.assertEqual(add_tag(self.work, Capture.objects.filter(user=self.user)), 6)
+        self.assertEqual(self.work.capture_set.count(), 6)
+        touched = Capture.objects.filter(updated_at__gte=timezone.now() - timedelta(hours=1))
+        self.assertNotIn(self.captures[0].pk, touched.values_list('pk', flat=True))
+        self.assertEqual(touched.count(), 5)
+
+        with self.assertNumQueries(4):  # savepoint, touch, delete, release
+            removed = remove_tag(self.work, Capture.objects.filter(title__in=['Note 1', 'Note 2']))
+        self.assertEqual(removed, 2)
+        self.assertEqual(self.work.capture_set.count(), 4)
+
+    def test_bulk_add_ignores_other_users_captures(self):
+        foreign = Capture.objects.create(user=self.other, title='Theirs', capture_type='TEXT')
+        self.assertEqual(add_tag(self.work, Capture.objects.filter(pk=foreign.pk)), 0)
+        self.assertFalse(foreign.tags.exists())
+
+
+class TagAdminTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('admin@example.com', 'pw')
+        Tag.objects.bulk_create([Tag(user=self.admin, name=name) for name in ('work', 'art', 'music')])
+        self.client.force_login(self.admin)
 
-# Create your tests here.
+    def test_changelist_orders_by_pk(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:tags_tag_changelist'))
+        self.assertEqual(response.status_code, 200)
+        listing = next(q['sql'] for q in queries if 'FROM "tags_tag" INNER JOIN' in q['sql'])
+        self.assertIn('ORDER BY "tags_tag"."id" DESC', listing)